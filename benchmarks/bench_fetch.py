@@ -0,0 +1,32 @@
+"""Comparar el ciclo de descarga secuencial, concurrente y por lotes.
+
+Uso: python -m benchmarks.bench_fetch
+"""
+import time
+
+import http_client
+from data_streaming import fetch_all_stations
+from benchmarks.fake_open_meteo import start_server
+from benchmarks.synthetic_data import synthetic_cities
+
+
+def bench_fetch(stations=32, latency=0.2, modes=((1, 1), (8, 1), (32, 1), (8, 50))):
+    server, url = start_server(latency=latency)
+    cities = synthetic_cities(stations)
+    print(f"\n=== BENCHMARK DE DESCARGA ({stations} estaciones, latencia {latency}s) ===\n")
+    try:
+        for max_workers, batch_size in modes:
+            # Sin cuotas: el servidor falso no las tiene y la espera falsearia la medicion
+            http_client.configure(pool_size=max_workers, quotas=())
+            start = time.perf_counter()
+            results = fetch_all_stations(cities, max_workers=max_workers, api_url=url, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            ok = sum(1 for data in results.values() if data)
+            print(f"max_workers={max_workers:>3} batch_size={batch_size:>3} | "
+                  f"{ok}/{stations} estaciones | {elapsed:.2f}s por ciclo")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    bench_fetch()
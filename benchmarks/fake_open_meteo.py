@@ -0,0 +1,100 @@
+"""Servidor HTTP local que imita la API de Open-Meteo para pruebas de rendimiento."""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def current_slot(interval=900):
+    """Inicio del intervalo de 15 minutos en curso (UTC), como el current.time de la API real"""
+    now = datetime.now(timezone.utc)
+    return now.replace(minute=now.minute - now.minute % (interval // 60), second=0, microsecond=0)
+
+
+def fake_current(lat, lon):
+    """Construir un bloque 'current' con valores sinteticos"""
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "current": {
+            "time": current_slot().strftime("%Y-%m-%dT%H:%M"),
+            "interval": 900,
+            "temperature_2m": round(random.uniform(24, 34), 1),
+            "relative_humidity_2m": random.randint(55, 95),
+            "pressure_msl": round(random.uniform(1005, 1015), 1),
+            "wind_speed_10m": round(random.uniform(0, 20), 1),
+            "wind_direction_10m": random.randint(0, 359),
+            "precipitation": round(random.uniform(0, 2), 1),
+            "cloud_cover": random.randint(0, 100),
+            "weather_code": random.choice([0, 1, 2, 3, 61, 80]),
+        },
+    }
+
+
+def fake_hourly(lat, lon, days):
+    """Construir arreglos 'hourly' de pronostico con valores sinteticos"""
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    hours = days * 24
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": {
+            "time": [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)],
+            "temperature_2m": [round(random.uniform(24, 34), 1) for _ in range(hours)],
+            "precipitation_probability": [random.randint(0, 100) for _ in range(hours)],
+            "weather_code": [random.choice([0, 1, 2, 3, 61, 80]) for _ in range(hours)],
+        },
+    }
+
+
+def make_handler(latency, error_rate=0.0):
+    class FakeOpenMeteoHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            # Fraccion de peticiones que fallan como lo haria la API sobrecargada
+            if error_rate and random.random() < error_rate:
+                self.send_error(503, "Servicio no disponible")
+                return
+            query = parse_qs(urlparse(self.path).query)
+            lats = [float(v) for v in query.get("latitude", ["0"])[0].split(",")]
+            lons = [float(v) for v in query.get("longitude", ["0"])[0].split(",")]
+            # Igual que la API real: varias coordenadas devuelven un arreglo
+            if "hourly" in query:
+                days = int(query.get("forecast_days", ["7"])[0])
+                locations = [fake_hourly(lat, lon, days) for lat, lon in zip(lats, lons)]
+            else:
+                locations = [fake_current(lat, lon) for lat, lon in zip(lats, lons)]
+            payload = locations[0] if len(locations) == 1 else locations
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeOpenMeteoHandler
+
+
+def start_server(port=0, latency=0.2, error_rate=0.0):
+    """Iniciar el servidor en un hilo y retornar (server, url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, error_rate))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/forecast"
+
+
+if __name__ == "__main__":
+    server, url = start_server(port=8080)
+    print(f"Open-Meteo falso escuchando en {url}")
+    print("Presiona Ctrl+C para detener\n")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,222 @@
+"""Suite de benchmarks reproducible contra un PostgreSQL local y un Open-Meteo falso.
+
+Uso:
+    python -m benchmarks.run_benchmarks --dsn postgresql://postgres@localhost/weather_bench
+    python -m benchmarks.run_benchmarks --dsn ... --sizes 10000 --compare benchmarks/results/anterior.json
+
+Para cada tamano se recrean las tablas, se cargan lecturas sinteticas y se mide
+el dashboard, la deteccion de outliers, el entrenamiento y la ingesta. Los
+resultados se guardan en JSON para comparar entre commits.
+
+ADVERTENCIA: borra y recrea las tablas del proyecto en la base de datos del DSN.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from math import ceil
+
+import db
+import http_client
+from benchmarks.fake_open_meteo import start_server
+from benchmarks.synthetic_data import populate, reset_schema, synthetic_cities
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+INGEST_ROWS = 50_000  # Lecturas que pasan por spool + writer en cada tamano
+STATIONS = 8
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def timed(func, *args, **kwargs):
+    """Ejecutar func sin su salida por consola; retorna (segundos, error o None)"""
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+    elapsed = time.perf_counter() - start
+    # Las funciones del proyecto imprimen "Error: ..." en vez de propagar la excepcion
+    errors = [line for line in out.getvalue().splitlines() if line.startswith("Error")]
+    return elapsed, errors[0] if errors else None
+
+
+def bench_dashboard():
+    """Latencia de update_dashboard en frio (sin series en memoria) y en un refresco incremental"""
+    import dashboard
+
+    dashboard._snapshot = None
+    dashboard._series = {}
+    dashboard._series_cursors.clear()
+    dashboard._trend.clear()
+    dashboard._trend_until = None
+    start = time.perf_counter()
+    outputs = dashboard.update_dashboard(0, None)
+    cold = time.perf_counter() - start
+
+    dashboard._snapshot = None  # Fuerza la consulta sin esperar SNAPSHOT_TTL
+    start = time.perf_counter()
+    dashboard.update_dashboard(1, outputs[4])
+    warm = time.perf_counter() - start
+    return [("update_dashboard_cold", {"seconds": cold}), ("update_dashboard_refresh", {"seconds": warm})]
+
+
+def bench_outliers():
+    from outlier_detection import detect_outliers, scan_outliers_history
+
+    results = []
+    for name, func in (("detect_outliers", detect_outliers), ("scan_outliers_history", scan_outliers_history)):
+        seconds, error = timed(func)
+        results.append((name, {"seconds": seconds, "error": error}))
+    return results
+
+
+def bench_train():
+    from ml_model import train_model
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        seconds, error = timed(train_model, full=True, model_dir=model_dir)
+    return [("train_model", {"seconds": seconds, "error": error})]
+
+
+def bench_ingest(rows=INGEST_ROWS, stations=STATIONS, latency=0.05, error_rate=0.0):
+    """Ciclo de stream_weather_data sin la espera de 60s: descarga, spool y SpoolDrainer hasta vaciarlo"""
+    from data_streaming import build_weather_reading, fetch_all_stations
+    from reading_spool import ReadingSpool
+    from weather_writer import SpoolDrainer
+
+    server, url = start_server(latency=latency, error_rate=error_rate)
+    cities = synthetic_cities(stations)
+    http = http_client.configure(quotas=())  # El servidor falso no tiene cuotas
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = fetch_all_stations(cities, api_url=url)
+        fetch_seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    readings = [build_weather_reading(city["id"], results[city["id"]]) for city in cities if results.get(city["id"])]
+    if not readings:
+        return [("fetch_cycle", {"seconds": fetch_seconds, "error": "sin respuestas del servidor falso"})]
+
+    # Se repite el ciclo minuto a minuto despues de los datos sinteticos hasta completar rows lecturas
+    base = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+    batch = [
+        reading[:-1] + (base + timedelta(minutes=minute),)
+        for minute in range(ceil(rows / len(readings))) for reading in readings
+    ][:rows]
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spool = ReadingSpool(os.path.join(spool_dir, "bench_spool.jsonl"))
+        start = time.perf_counter()
+        spool.append(batch)
+        drainer = SpoolDrainer(spool, detect_outliers=False, forecasts=False)
+        drainer.start()
+        drainer.stop()
+        elapsed = time.perf_counter() - start
+
+    return [
+        ("fetch_cycle", {"seconds": fetch_seconds, "stations_ok": len(readings), "stations": stations,
+                         **{f"http_{k}": v for k, v in http.metrics().items()}}),
+        ("ingest", {"seconds": elapsed, "rows": len(batch), "rows_per_second": len(batch) / elapsed,
+                    "writer_rows_per_second": drainer.writer.rows_per_second(),
+                    "error": None if spool.is_drained() else "el spool no se vacio"}),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def run(dsn, sizes=DEFAULT_SIZES, stations=STATIONS, ingest_rows=INGEST_ROWS, latency=0.05, error_rate=0.0,
+        compact=False):
+    db.configure({"dsn": dsn})
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "stations": stations,
+        "schema": "compact" if compact else "default",
+        "results": [],
+    }
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version;")
+            report["postgres"] = cursor.fetchone()[0]
+
+    for size in sizes:
+        print(f"\n=== {size:,} lecturas ===")
+        with db.get_connection() as conn:
+            with contextlib.redirect_stdout(io.StringIO()):
+                reset_schema(conn, compact)
+            start = time.perf_counter()
+            populate(conn, size, stations)
+        print(f"Datos sinteticos cargados en {time.perf_counter() - start:.1f}s")
+
+        # La ingesta va al final porque agrega filas a current_weather
+        benches = [
+            ("dashboard", bench_dashboard), ("outliers", bench_outliers), ("train", bench_train),
+            ("ingest", lambda: bench_ingest(ingest_rows, stations, latency, error_rate)),
+        ]
+        for bench_name, bench in benches:
+            try:
+                results = bench()
+            except Exception as e:
+                results = [(bench_name, {"seconds": 0.0, "error": str(e)})]
+            for name, metrics in results:
+                report["results"].append({"size": size, "name": name, **metrics})
+                extra = f" | {metrics['rows_per_second']:,.0f} filas/s" if "rows_per_second" in metrics else ""
+                error = f" | ERROR: {metrics['error']}" if metrics.get("error") else ""
+                print(f"  {name:<26} {metrics['seconds']:>9.3f}s{extra}{error}")
+    db.close_all()
+    return report
+
+
+def compare(previous, report, tolerance=0.10):
+    """Imprimir la variacion de tiempo respecto a un reporte anterior"""
+    old = {(r["size"], r["name"]): r for r in previous["results"]}
+    print(f"\n=== COMPARACION CON {previous['commit']} ({previous['created_at']}) ===")
+    for result in report["results"]:
+        before = old.get((result["size"], result["name"]))
+        if not before or not before["seconds"]:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = "  <-- mas lento" if ratio > 1 + tolerance else ""
+        print(f"  {result['size']:>10,} {result['name']:<26} {before['seconds']:>9.3f}s -> "
+              f"{result['seconds']:>9.3f}s ({ratio:.2f}x){flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks con PostgreSQL local y Open-Meteo falso")
+    parser.add_argument("--dsn", required=True, help="base de datos desechable; sus tablas se borran")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--stations", type=int, default=STATIONS)
+    parser.add_argument("--ingest-rows", type=int, default=INGEST_ROWS)
+    parser.add_argument("--latency", type=float, default=0.05, help="latencia del Open-Meteo falso (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraccion de peticiones que fallan")
+    parser.add_argument("--compact", action="store_true", help="usar el perfil compacto de current_weather")
+    parser.add_argument("--output", help="archivo JSON de resultados (por defecto en benchmarks/results/)")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    report = run(args.dsn, args.sizes, args.stations, args.ingest_rows, args.latency, args.error_rate, args.compact)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['created_at'].replace(':', '')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
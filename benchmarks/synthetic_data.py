@@ -0,0 +1,80 @@
+"""Datos sinteticos reproducibles para los benchmarks.
+
+Las lecturas se generan dentro de PostgreSQL con generate_series, asi que
+cargar 10 millones de filas no pasa por Python.
+"""
+import random
+from datetime import datetime, timedelta
+
+from create_tables import create_tables
+
+# Tablas que crea create_tables.py; se borran antes de cada tamano de benchmark
+BENCH_TABLES = [
+    "weather_rollup_1d", "weather_rollup_1h", "weather_rollup_1m", "alerts", "outlier_checkpoint",
+    "outlier_state", "station_latest", "station_stats", "weather_forecasts", "current_weather",
+    "weather_stations",
+]
+
+
+def synthetic_cities(n, seed=42):
+    """Estaciones repartidas sobre la costa Caribe con el formato de station_registry.get_active_stations"""
+    rng = random.Random(seed)
+    return [
+        {"id": i + 1, "name": f"Punto {i + 1}", "lat": round(8 + rng.random() * 5, 4), "lon": round(-76 + rng.random() * 4, 4)}
+        for i in range(n)
+    ]
+
+
+def reset_schema(conn, compact=False):
+    """Borrar las tablas del proyecto y crearlas de nuevo vacias (solo para la base de datos de benchmark)"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {', '.join(BENCH_TABLES)} CASCADE;")
+    conn.commit()
+    create_tables(compact=compact)
+
+
+def populate(conn, rows, stations=8, end=None, seed=0.42):
+    """Cargar rows lecturas (una por minuto y estacion) que terminan en end, mas station_stats y station_latest"""
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(minutes=max(rows // stations - 1, 0))
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s);", (seed,))
+        cursor.execute("""
+            INSERT INTO weather_stations (station_id, city_name, department, latitude, longitude, elevation)
+            SELECT id, 'Punto ' || id, 'Sintetico', 8 + random() * 5, -76 + random() * 4, (random() * 100)::int
+            FROM generate_series(1, %s) AS id;
+
+            SELECT setval(pg_get_serial_sequence('weather_stations', 'station_id'), %s);
+        """, (stations, stations))
+        # Ciclo diario de temperatura y presion con ruido; algunos saltos y rafagas para los outliers
+        cursor.execute("""
+            INSERT INTO current_weather (station_id, temperature, humidity, pressure, wind_speed, wind_direction,
+                                         precipitation, cloud_cover, weather_code, timestamp)
+            SELECT
+                1 + g %% %(stations)s,
+                round((28 + 4 * sin(2 * pi() * (g / %(stations)s) / 1440.0) + random() * 2
+                       + CASE WHEN random() < 0.001 THEN 8 ELSE 0 END)::numeric, 2),
+                (60 + random() * 35)::int,
+                round((1010 + 3 * cos(2 * pi() * (g / %(stations)s) / 1440.0) + random() * 2)::numeric, 2),
+                round((random() * 12 + CASE WHEN random() < 0.002 THEN 10 ELSE 0 END)::numeric, 2),
+                (random() * 359)::int,
+                round((CASE WHEN random() < 0.1 THEN random() * 5 ELSE 0 END)::numeric, 2),
+                (random() * 100)::int,
+                (ARRAY[0, 1, 2, 3, 61, 80])[1 + (random() * 5)::int],
+                %(start)s::timestamp + (g / %(stations)s) * interval '1 minute'
+            FROM generate_series(0, %(rows)s - 1) AS g;
+        """, {"stations": stations, "rows": rows, "start": start})
+        cursor.execute("""
+            INSERT INTO station_stats (station_id, reading_count, last_reading)
+            SELECT station_id, COUNT(*), MAX(timestamp) FROM current_weather GROUP BY station_id;
+
+            INSERT INTO station_latest (station_id, temperature, humidity, pressure, wind_speed, wind_direction,
+                                        precipitation, cloud_cover, weather_code, timestamp)
+            SELECT DISTINCT ON (station_id) station_id, temperature, humidity, pressure, wind_speed, wind_direction,
+                   precipitation, cloud_cover, weather_code, timestamp
+            FROM current_weather
+            ORDER BY station_id, timestamp DESC;
+
+            ANALYZE;
+        """)
+    conn.commit()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import statistics
+import time
+from datetime import timedelta
+from db import get_connection
+from reading_key import KEY_INDEX, ensure_reading_key
+
+# Perfil compacto de current_weather: real (4 bytes, ~7 digitos, sobra para la resolucion de 0.1
+# de Open-Meteo) en vez de DECIMAL y smallint para porcentajes, grados y codigos WMO
+COMPACT_TYPES = {
+    "temperature": "real",
+    "humidity": "smallint",
+    "pressure": "real",
+    "wind_speed": "real",
+    "wind_direction": "smallint",
+    "precipitation": "real",
+    "cloud_cover": "smallint",
+    "weather_code": "smallint",
+}
+MEASURE_REPEATS = 5  # Ejecuciones de cada consulta al medir la latencia (se reporta la mediana)
+
+# Solo cambian los tipos: los indices (btree de timestamp y clave unica) se reconstruyen igual que antes.
+# El btree de timestamp es el que sirve ORDER BY timestamp DESC LIMIT del dashboard y de Streamlit
+COMPACT_SQL = f"""
+    ALTER TABLE current_weather
+        {", ".join(f"ALTER COLUMN {col} TYPE {type_}" for col, type_ in COMPACT_TYPES.items())};
+"""
+
+# Una version anterior del perfil cambiaba el btree de timestamp por un BRIN y agregaba columnas INCLUDE a la
+# clave: mas espacio en indices y consultas mas lentas. Se vuelven a crear como en el perfil normal
+RESTORE_INDEXES_SQL = f"""
+    DROP INDEX IF EXISTS idx_timestamp;
+    DROP INDEX IF EXISTS {KEY_INDEX};
+
+    CREATE INDEX idx_timestamp ON current_weather(timestamp);
+    CREATE UNIQUE INDEX {KEY_INDEX} ON current_weather(station_id, timestamp);
+"""
+
+def is_compact(cursor):
+    """True si current_weather ya tiene el perfil compacto"""
+    cursor.execute("""
+        SELECT data_type = 'real' FROM information_schema.columns
+        WHERE table_name = 'current_weather' AND column_name = 'temperature';
+    """)
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+def has_legacy_indexes(cursor):
+    """True si quedan el BRIN de timestamp o la clave con INCLUDE de la version anterior del perfil"""
+    cursor.execute("""
+        SELECT COALESCE(bool_or(pg_get_indexdef(i.indexrelid) ~ 'USING brin|INCLUDE'), FALSE)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass('current_weather') AND c.relname IN ('idx_timestamp', %s);
+    """, (KEY_INDEX,))
+    return cursor.fetchone()[0]
+
+def apply_compact_profile(cursor):
+    """Cambiar los tipos de current_weather (particionada o no) al perfil compacto.
+
+    Reescribe la tabla con un lock exclusivo; en una tabla vacia (create_tables.py
+    --compact) es instantaneo. Retorna False si no habia nada que cambiar.
+    """
+    changed = False
+    if not is_compact(cursor):
+        ensure_reading_key(cursor)
+        cursor.execute(COMPACT_SQL)
+        changed = True
+    if has_legacy_indexes(cursor):
+        cursor.execute(RESTORE_INDEXES_SQL)
+        changed = True
+    return changed
+
+def _hot_queries():
+    """Consultas del dashboard y de Streamlit que se miden antes y despues de migrar"""
+    from dashboard import RAW_WINDOW_HOURS, SNAPSHOT_QUERY
+    from station_latest import RECENT_READINGS_QUERY
+    return {
+        "dashboard_last_hour": (SNAPSHOT_QUERY, {"since": None, "window": timedelta(hours=RAW_WINDOW_HOURS)}),
+        "streamlit_recent_readings": (RECENT_READINGS_QUERY, None),
+    }
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def measure(conn, repeats=MEASURE_REPEATS):
+    """Tamano de current_weather e indices, y latencia (mediana en ms) de las consultas del dashboard"""
+    result = {"queries": {}}
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT COALESCE(SUM(pg_relation_size(c.oid)), 0)::bigint, COALESCE(SUM(pg_indexes_size(c.oid)), 0)::bigint,
+                   COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+            FROM pg_class c
+            WHERE c.oid = 'current_weather'::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'current_weather'::regclass);
+        """)
+        table_bytes, index_bytes, rows = cursor.fetchone()
+        result.update(table_bytes=table_bytes, index_bytes=index_bytes, rows=rows,
+                      bytes_per_row=round((table_bytes + index_bytes) / rows, 1) if rows else None)
+
+        for name, (query, params) in _hot_queries().items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+            scans = sorted({node["Node Type"] for node in _plan_nodes(plan)
+                            if "Scan" in node["Node Type"] and node.get("Relation Name", "").startswith("current_weather")})
+            result["queries"][name] = {"ms": round(statistics.median(timings), 2), "scans": scans}
+    conn.rollback()
+    return result
+
+def print_measurements(label, m):
+    print(f"\n{label}: tabla {m['table_bytes'] / 2**20:.1f} MB | indices {m['index_bytes'] / 2**20:.1f} MB | "
+          f"{m['rows']} filas | {m['bytes_per_row']} bytes/fila")
+    for name, q in m["queries"].items():
+        print(f"   {name:<28} {q['ms']:>9.2f} ms  ({', '.join(q['scans']) or 'sin current_weather'})")
+
+def migrate_to_compact(repeats=MEASURE_REPEATS, output=None):
+    """Migrar current_weather al perfil compacto midiendo tamano y latencia antes y despues"""
+    try:
+        with get_connection() as conn:
+            before = measure(conn, repeats)
+            print_measurements("Antes", before)
+
+            with conn.cursor() as cursor:
+                if not apply_compact_profile(cursor):
+                    print("\ncurrent_weather ya tiene el perfil compacto")
+                    return
+            conn.commit()
+            print("\nTipos compactos aplicados")
+
+            # VACUUM no corre dentro de una transaccion; deja estadisticas y mapa de visibilidad al dia para medir
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("VACUUM (ANALYZE) current_weather;")
+            finally:
+                conn.autocommit = False
+
+            after = measure(conn, repeats)
+            print_measurements("Despues", after)
+
+        before_total = before["table_bytes"] + before["index_bytes"]
+        after_total = after["table_bytes"] + after["index_bytes"]
+        if after_total:
+            print(f"\nEspacio: {before_total / 2**20:.1f} MB -> {after_total / 2**20:.1f} MB "
+                  f"({before_total / after_total:.2f}x filas por GB)")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump({"before": before, "after": after}, f, indent=2)
+            print(f"Mediciones guardadas en {output}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil compacto de current_weather (real/smallint)")
+    parser.add_argument("--measure", action="store_true", help="solo medir tamano y latencia, sin migrar")
+    parser.add_argument("--repeats", type=int, default=MEASURE_REPEATS)
+    parser.add_argument("--output", help="archivo JSON con las mediciones antes y despues")
+    args = parser.parse_args()
+
+    if args.measure:
+        try:
+            with get_connection() as conn:
+                print_measurements("current_weather", measure(conn, args.repeats))
+        except Exception as e:
+            print(f"Error: {e}")
+    else:
+        migrate_to_compact(args.repeats, args.output)
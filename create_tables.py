@@ -1,77 +1,142 @@
-import psycopg2
-from config import DB_CONFIG
+import argparse
+from compact_schema import apply_compact_profile
+from db import get_connection
+from outlier_detection import create_outlier_tables
+from partitions import create_partitioned_table
+from reading_key import ensure_reading_key
+from rollups import create_rollup_tables
+from shards import create_worker_table
+from station_latest import create_station_latest_table
+from station_registry import ensure_registry_schema
 
-def create_tables():
+def create_tables(partitioned=False, compact=False):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        print("Creando tablas en Azure PostgreSQL...")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weather_stations (
-                station_id SERIAL PRIMARY KEY,
-                city_name VARCHAR(100) NOT NULL,
-                department VARCHAR(100),
-                latitude DECIMAL(10, 6),
-                longitude DECIMAL(10, 6),
-                elevation INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        print("Tabla weather_stations creada")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS current_weather (
-                reading_id SERIAL PRIMARY KEY,
-                station_id INTEGER REFERENCES weather_stations(station_id),
-                temperature DECIMAL(5, 2),
-                humidity INTEGER,
-                pressure DECIMAL(6, 2),
-                wind_speed DECIMAL(5, 2),
-                wind_direction INTEGER,
-                precipitation DECIMAL(5, 2),
-                cloud_cover INTEGER,
-                weather_code INTEGER,
-                timestamp TIMESTAMP NOT NULL
-            );
-            
-            CREATE INDEX IF NOT EXISTS idx_timestamp ON current_weather(timestamp);
-            CREATE INDEX IF NOT EXISTS idx_station_timestamp ON current_weather(station_id, timestamp);
-        """)
-        print("Tabla current_weather creada con indices")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weather_forecasts (
-                forecast_id SERIAL PRIMARY KEY,
-                station_id INTEGER REFERENCES weather_stations(station_id),
-                forecast_time TIMESTAMP NOT NULL,
-                temperature DECIMAL(5, 2),
-                precipitation_prob INTEGER,
-                conditions VARCHAR(100),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        print("Tabla weather_forecasts creada")
-        
-        conn.commit()
-        print("\nTodas las tablas creadas exitosamente!")
-        
-        cursor.execute("""
-            SELECT table_name FROM information_schema.tables 
-            WHERE table_schema = 'public' ORDER BY table_name;
-        """)
-        
-        tables = cursor.fetchall()
-        print("\nTablas en la base de datos:")
-        for table in tables:
-            print(f"   - {table[0]}")
-        
-        cursor.close()
-        conn.close()
-        
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            print("Creando tablas en Azure PostgreSQL...")
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS weather_stations (
+                    station_id SERIAL PRIMARY KEY,
+                    city_name VARCHAR(100) NOT NULL,
+                    department VARCHAR(100),
+                    latitude DECIMAL(10, 6),
+                    longitude DECIMAL(10, 6),
+                    elevation INTEGER,
+                    active BOOLEAN NOT NULL DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            print("Tabla weather_stations creada")
+            
+            if partitioned:
+                created = create_partitioned_table(cursor)
+                print(f"Tabla current_weather particionada por tiempo creada ({len(created)} particiones nuevas)")
+            else:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS current_weather (
+                        reading_id SERIAL PRIMARY KEY,
+                        station_id INTEGER REFERENCES weather_stations(station_id),
+                        temperature DECIMAL(5, 2),
+                        humidity INTEGER,
+                        pressure DECIMAL(6, 2),
+                        wind_speed DECIMAL(5, 2),
+                        wind_direction INTEGER,
+                        precipitation DECIMAL(5, 2),
+                        cloud_cover INTEGER,
+                        weather_code INTEGER,
+                        timestamp TIMESTAMP NOT NULL
+                    );
+                    
+                    CREATE INDEX IF NOT EXISTS idx_timestamp ON current_weather(timestamp);
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_station_timestamp ON current_weather(station_id, timestamp);
+                """)
+                print("Tabla current_weather creada con indices")
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS weather_forecasts (
+                    forecast_id SERIAL PRIMARY KEY,
+                    station_id INTEGER REFERENCES weather_stations(station_id),
+                    forecast_time TIMESTAMP NOT NULL,
+                    temperature DECIMAL(5, 2),
+                    precipitation_prob INTEGER,
+                    conditions VARCHAR(100),
+                    source VARCHAR(20) NOT NULL DEFAULT 'api',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                -- Cada fuente (API o modelo por estacion) tiene un solo pronostico por estacion y hora
+                ALTER TABLE weather_forecasts ADD COLUMN IF NOT EXISTS source VARCHAR(20) NOT NULL DEFAULT 'api';
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_forecasts_station_source_time
+                    ON weather_forecasts(station_id, source, forecast_time);
+            """)
+            print("Tabla weather_forecasts creada")
+            
+            # Contadores por estacion mantenidos por el writer (evita COUNT(*) sobre el historico)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS station_stats (
+                    station_id INTEGER PRIMARY KEY REFERENCES weather_stations(station_id),
+                    reading_count BIGINT NOT NULL DEFAULT 0,
+                    last_reading TIMESTAMP
+                );
+                
+                INSERT INTO station_stats (station_id, reading_count, last_reading)
+                SELECT station_id, COUNT(*), MAX(timestamp)
+                FROM current_weather
+                WHERE NOT EXISTS (SELECT 1 FROM station_stats)
+                GROUP BY station_id;
+            """)
+            print("Tabla station_stats creada")
+            
+            create_station_latest_table(cursor)
+            print("Tabla station_latest creada")
+            
+            create_outlier_tables(cursor)
+            print("Tablas outlier_state, outlier_checkpoint y alerts creadas")
+            
+            create_rollup_tables(cursor)
+            print("Tablas de agregados weather_rollup_1m/1h/1d creadas (ejecuta rollups.py --backfill para el historico)")
+            
+            # Bases anteriores: quitar duplicados y volver unico (station_id, timestamp)
+            removed = ensure_reading_key(cursor)
+            print(f"Clave natural (station_id, timestamp) en current_weather ({removed} lecturas duplicadas borradas)")
+            if removed:
+                print("station_stats, station_latest y agregados recalculados sin los duplicados")
+            
+            if compact and apply_compact_profile(cursor):
+                print("Perfil compacto en current_weather: real/smallint")
+            
+            create_worker_table(cursor)
+            print("Tabla ingest_workers creada (latidos del modo multi-worker)")
+            
+            # Va al final porque revisa current_weather y station_stats antes de borrar duplicados
+            ensure_registry_schema(cursor)
+            print("Clave unica (latitude, longitude) y columna active en weather_stations")
+            
+            conn.commit()
+            print("\nTodas las tablas creadas exitosamente!")
+            
+            cursor.execute("""
+                SELECT table_name FROM information_schema.tables 
+                WHERE table_schema = 'public' ORDER BY table_name;
+            """)
+            
+            tables = cursor.fetchall()
+            print("\nTablas en la base de datos:")
+            for table in tables:
+                print(f"   - {table[0]}")
+            
+            cursor.close()
+            
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    create_tables()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Crear las tablas del sistema")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="crear current_weather particionada por tiempo (ver partitions.py)")
+    parser.add_argument("--compact", action="store_true",
+                        help="perfil compacto de current_weather (ver compact_schema.py)")
+    args = parser.parse_args()
+    create_tables(partitioned=args.partitioned, compact=args.compact)
\ No newline at end of file
@@ -1,79 +1,247 @@
 ﻿import dash
-from dash import dcc, html, dash_table
-from dash.dependencies import Input, Output
+from dash import dcc, html, dash_table, Patch
+from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
-import psycopg2
 import pandas as pd
-from datetime import datetime
-from config import DB_CONFIG
+import heapq
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from db import get_connection
+from poll_scheduler import SOURCE_INTERVAL
+from rollups import get_rollup
 
 # Crear app
 app = dash.Dash(__name__)
 app.title = "Dashboard Climatico Costa Caribe"
 
-# Funcion para conectar a la base de datos
-def get_connection():
-    return psycopg2.connect(**DB_CONFIG)
-
-def get_current_weather():
-    conn = get_connection()
-    query = """
-        SELECT 
-            ws.city_name,
-            ws.department,
-            ws.latitude,
-            ws.longitude,
-            cw.temperature,
-            cw.humidity,
-            cw.pressure,
-            cw.wind_speed,
-            cw.precipitation,
-            cw.cloud_cover,
-            cw.timestamp
-        FROM current_weather cw
-        JOIN weather_stations ws ON cw.station_id = ws.station_id
-        WHERE cw.timestamp >= NOW() - INTERVAL '1 hour'
-        ORDER BY cw.timestamp DESC;
-    """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
-
-def get_latest_readings():
-    conn = get_connection()
-    query = """
-        SELECT DISTINCT ON (ws.city_name)
-            ws.city_name,
-            ws.latitude,
-            ws.longitude,
-            cw.temperature,
-            cw.humidity,
-            cw.wind_speed
-        FROM current_weather cw
-        JOIN weather_stations ws ON cw.station_id = ws.station_id
-        ORDER BY ws.city_name, cw.timestamp DESC;
-    """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+SNAPSHOT_TTL = 30  # Segundos que se reutiliza una misma lectura de la base de datos
+TREND_WINDOW_HOURS = 1  # Ventana de la grafica de tendencia (por ejemplo 24 o 24 * 7)
+TREND_ROLLUP_HOURS = 6  # Ventanas mas largas se grafican con los promedios por hora de weather_rollup_1h
+TREND_ROLLUP_SETTLE = timedelta(minutes=10)  # Margen para que lleguen las ultimas lecturas de una hora cerrada
+USE_ROLLUP_TREND = TREND_WINDOW_HOURS > TREND_ROLLUP_HOURS
+# Lecturas crudas que se leen: la ventana de la tendencia, o solo la ultima hora (para la tabla) con agregados
+RAW_WINDOW_HOURS = 1 if USE_ROLLUP_TREND else TREND_WINDOW_HOURS
+# Lecturas por hora de cada estacion segun la cadencia de la fuente (una cada SOURCE_INTERVAL)
+READINGS_PER_HOUR = max(1, 3600 // SOURCE_INTERVAL)
+# Tope de puntos por estacion: uno por hora con agregados, o una lectura por intervalo de la fuente
+TREND_MAX_POINTS = (TREND_WINDOW_HOURS if USE_ROLLUP_TREND else TREND_WINDOW_HOURS * READINGS_PER_HOUR) + 1
+TABLE_ROWS = 20
+
+WEATHER_COLUMNS = ['city_name', 'department', 'latitude', 'longitude', 'temperature', 'humidity',
+                   'pressure', 'wind_speed', 'precipitation', 'cloud_cover', 'timestamp']
+LATEST_COLUMNS = ['city_name', 'latitude', 'longitude', 'temperature', 'humidity', 'wind_speed']
+
+# Una sola consulta (un viaje de red) para estadisticas, ultimas lecturas y las
+# lecturas nuevas desde el ultimo timestamp visto de cada estacion (o la ventana
+# completa al iniciar). since es un JSON station_id -> timestamp: las estaciones se
+# consultan y confirman en tiempos distintos, asi que un cursor global saltaria
+# lecturas que llegan despues de una mas nueva de otra estacion.
+# Las lecturas nuevas se buscan por estacion en el indice (station_id, timestamp)
+SNAPSHOT_QUERY = """
+    SELECT json_build_object(
+        'stats', (
+            SELECT json_build_object(
+                'total_readings', COALESCE(SUM(reading_count), 0),
+                'active_stations', COUNT(*),
+                'last_update', MAX(last_reading)
+            )
+            FROM station_stats
+        ),
+        'latest', (
+            SELECT COALESCE(json_agg(l), '[]')
+            FROM (
+                SELECT
+                    ws.city_name,
+                    ws.latitude,
+                    ws.longitude,
+                    sl.temperature,
+                    sl.humidity,
+                    sl.wind_speed
+                FROM station_latest sl
+                JOIN weather_stations ws ON sl.station_id = ws.station_id
+                ORDER BY ws.city_name
+            ) l
+        ),
+        'weather', (
+            SELECT COALESCE(json_agg(w), '[]')
+            FROM (
+                SELECT 
+                    ws.station_id,
+                    ws.city_name,
+                    ws.department,
+                    ws.latitude,
+                    ws.longitude,
+                    cw.temperature,
+                    cw.humidity,
+                    cw.pressure,
+                    cw.wind_speed,
+                    cw.precipitation,
+                    cw.cloud_cover,
+                    cw.timestamp
+                FROM weather_stations ws
+                CROSS JOIN LATERAL (
+                    SELECT temperature, humidity, pressure, wind_speed, precipitation, cloud_cover, timestamp
+                    FROM current_weather
+                    WHERE station_id = ws.station_id
+                      AND timestamp > GREATEST((%(since)s::jsonb ->> ws.station_id::text)::timestamp,
+                                               LOCALTIMESTAMP - %(window)s)
+                ) cw
+                ORDER BY cw.timestamp
+            ) w
+        )
+    );
+"""
+
+_snapshot = None
+_snapshot_time = 0.0
+_snapshot_lock = threading.Lock()
+_series = {}  # city_name -> deque de lecturas ordenadas por timestamp
+_series_cursors = {}  # station_id -> timestamp mas reciente leido de la base de datos
+_trend = {}  # city_name -> deque de (timestamp, temperatura) de la grafica de tendencia
+_trend_until = None  # Con agregados: hora cerrada hasta la que ya se leyo weather_rollup_1h
 
-def get_statistics():
-    conn = get_connection()
-    cursor = conn.cursor()
+def load_snapshot():
+    """Leer las lecturas nuevas y agregarlas al buffer circular de cada estacion"""
+    since = {str(station_id): ts.isoformat() for station_id, ts in _series_cursors.items()}
+    params = {'since': json.dumps(since), 'window': timedelta(hours=RAW_WINDOW_HOURS)}
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SNAPSHOT_QUERY, params)
+        data = cursor.fetchone()[0]
+        cursor.close()
     
-    cursor.execute("SELECT COUNT(*) FROM current_weather;")
-    total_readings = cursor.fetchone()[0]
+    for row in data['weather']:
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        station_id = row.pop('station_id')
+        _series.setdefault(row['city_name'], deque(maxlen=RAW_WINDOW_HOURS * READINGS_PER_HOUR + 1)).append(row)
+        _series_cursors[station_id] = max(_series_cursors.get(station_id, row['timestamp']), row['timestamp'])
+        if not USE_ROLLUP_TREND:
+            _trend.setdefault(row['city_name'], deque(maxlen=TREND_MAX_POINTS)).append((row['timestamp'], row['temperature']))
     
-    cursor.execute("SELECT COUNT(DISTINCT station_id) FROM current_weather;")
-    active_stations = cursor.fetchone()[0]
+    # Descartar lo que salio de la ventana
+    if _series_cursors:
+        window_start = max(_series_cursors.values()) - timedelta(hours=RAW_WINDOW_HOURS)
+        for rows in _series.values():
+            while rows and rows[0]['timestamp'] < window_start:
+                rows.popleft()
+    if USE_ROLLUP_TREND:
+        load_rollup_trend()
+    elif _series_cursors:
+        for points in _trend.values():
+            while points and points[0][0] < window_start:
+                points.popleft()
     
-    cursor.execute("SELECT MAX(timestamp) FROM current_weather;")
-    last_update = cursor.fetchone()[0]
+    df_latest = pd.DataFrame(data['latest'], columns=LATEST_COLUMNS)
+    stats = data['stats']
+    last_update = stats['last_update']
+    last_update = datetime.fromisoformat(last_update) if last_update else None
+    return df_latest, (stats['total_readings'], stats['active_stations'], last_update)
+
+def load_rollup_trend():
+    """Agregar a la tendencia los promedios por hora de las horas que cerraron desde la ultima lectura.
+
+    Solo se leen horas cerradas hace mas de TREND_ROLLUP_SETTLE, que ya no
+    cambian, asi que basta un limite comun para todas las estaciones y
+    weather_rollup_1h se consulta una vez por hora.
+    """
+    global _trend_until
+    until = (datetime.now() - TREND_ROLLUP_SETTLE).replace(minute=0, second=0, microsecond=0)
+    if _trend_until is not None and until <= _trend_until:
+        return
+    since = _trend_until or until - timedelta(hours=TREND_WINDOW_HOURS)
+    df = get_rollup('1h', since=since, until=until)
+    for row in df.itertuples():
+        if not pd.isna(row.temperature_mean):
+            _trend.setdefault(row.city_name, deque(maxlen=TREND_MAX_POINTS)).append(
+                (row.bucket.to_pydatetime(), float(row.temperature_mean)))
+    _trend_until = until
+
+def get_snapshot():
+    """Snapshot compartido por todas las pestanas; se relee como maximo una vez por SNAPSHOT_TTL"""
+    global _snapshot, _snapshot_time
+    with _snapshot_lock:
+        if _snapshot is None or time.monotonic() - _snapshot_time >= SNAPSHOT_TTL:
+            _snapshot = load_snapshot()
+            _snapshot_time = time.monotonic()
+        return _snapshot
+
+def get_trend_points(since=None):
+    """Puntos (timestamp, temperatura) por estacion posteriores a su cursor en since (city_name -> timestamp).
+
+    Retorna tambien cuantos puntos hasta el cursor siguen dentro de la ventana,
+    para que el navegador descarte los que ya salieron.
+    """
+    since = since or {}
+    with _snapshot_lock:
+        points = {}
+        kept = {}
+        for city, trend in _trend.items():
+            new_points = []
+            city_since = since.get(city)
+            for ts, temp in reversed(trend):
+                if city_since is not None and ts <= city_since:
+                    break
+                new_points.append((ts, temp))
+            points[city] = new_points[::-1]
+            kept[city] = len(trend) - len(new_points)
+        return points, kept
+
+def get_recent_rows(limit=TABLE_ROWS):
+    """Ultimas lecturas de todas las estaciones para la tabla"""
+    with _snapshot_lock:
+        rows = heapq.nlargest(limit, (row for rows in _series.values() for row in rows),
+                              key=lambda row: row['timestamp'])
+    return pd.DataFrame(rows, columns=WEATHER_COLUMNS)
+
+def build_trend_update(trend_state):
+    """Figura completa la primera vez; despues un Patch con los puntos nuevos y sin los que salieron de la ventana.
+
+    El navegador guarda cuantos puntos tiene cada traza; los que sobran respecto
+    a los que _trend conserva hasta el cursor son los mas viejos y se borran del
+    inicio, asi la grafica cubre TREND_WINDOW_HOURS sin importar la cadencia.
+    """
+    if trend_state is not None and 'counts' in trend_state:
+        cursors = trend_state['cursors']
+        counts = trend_state['counts']
+        points, kept = get_trend_points({city: datetime.fromisoformat(ts) for city, ts in cursors.items()})
+        stations = trend_state['stations']
+        if set(points) == set(stations) and all(kept[city] <= counts.get(city, 0) for city in points):
+            patch = Patch()
+            changed = False
+            for city, new_points in points.items():
+                trace = patch['data'][stations.index(city)]
+                for _ in range(counts.get(city, 0) - kept[city]):
+                    del trace['x'][0]
+                    del trace['y'][0]
+                if new_points:
+                    trace['x'].extend([ts.isoformat() for ts, _ in new_points])
+                    trace['y'].extend([temp for _, temp in new_points])
+                    cursors[city] = new_points[-1][0].isoformat()
+                changed = changed or bool(new_points) or counts.get(city, 0) != kept[city]
+                counts[city] = kept[city] + len(new_points)
+            if not changed:
+                return dash.no_update, dash.no_update
+            return patch, {'stations': stations, 'cursors': cursors, 'counts': counts}
     
-    cursor.close()
-    conn.close()
-    return total_readings, active_stations, last_update
+    # Primera carga, aparecio una estacion nueva o el servidor perdio puntos: se arma la figura completa
+    points, _ = get_trend_points()
+    stations = sorted(points)
+    window = "ultima hora" if TREND_WINDOW_HOURS == 1 else f"ultimas {TREND_WINDOW_HOURS} horas"
+    if USE_ROLLUP_TREND:
+        window += ", promedio por hora"
+    fig_temp = go.Figure([
+        go.Scatter(x=[ts for ts, _ in points[city]], y=[temp for _, temp in points[city]], mode='lines', name=city)
+        for city in stations
+    ])
+    fig_temp.update_layout(height=400, title=f"Tendencia de Temperatura ({window})",
+                           xaxis_title="timestamp", yaxis_title="temperature", legend_title="city_name")
+    cursors = {city: p[-1][0].isoformat() for city, p in points.items() if p}
+    counts = {city: len(p) for city, p in points.items()}
+    return fig_temp, {'stations': stations, 'cursors': cursors, 'counts': counts}
 
 # Layout
 app.layout = html.Div([
@@ -112,6 +280,9 @@ app.layout = html.Div([
     html.H3("Datos Recientes", style={'textAlign': 'center'}),
     html.Div(id='data-table', style={'margin': '20px'}),
     
+    # Estado de la grafica de tendencia en este navegador (estaciones, ultimo punto enviado y puntos de cada una)
+    dcc.Store(id='trend-state'),
+    
     dcc.Interval(
         id='interval-component',
         interval=30*1000,  # 30 segundos
@@ -124,15 +295,15 @@ app.layout = html.Div([
      Output('map-temperature', 'figure'),
      Output('current-temps', 'children'),
      Output('temp-trend', 'figure'),
+     Output('trend-state', 'data'),
      Output('wind-chart', 'figure'),
      Output('data-table', 'children')],
-    [Input('interval-component', 'n_intervals')]
+    [Input('interval-component', 'n_intervals')],
+    [State('trend-state', 'data')]
 )
-def update_dashboard(n):
-    # Obtener datos
-    df_weather = get_current_weather()
-    df_latest = get_latest_readings()
-    total_readings, active_stations, last_update = get_statistics()
+def update_dashboard(n, trend_state):
+    # Obtener datos (snapshot compartido entre sesiones)
+    df_latest, (total_readings, active_stations, last_update) = get_snapshot()
     
     # Estadisticas
     stats = html.Div([
@@ -176,15 +347,8 @@ def update_dashboard(n):
                    style={'margin': '5px', 'fontSize': '14px'})
         ], style={'padding': '10px', 'border': '1px solid #ddd', 'margin': '5px', 'borderRadius': '5px'}))
     
-    # Tendencia de temperatura
-    fig_temp = px.line(
-        df_weather,
-        x="timestamp",
-        y="temperature",
-        color="city_name",
-        title="Tendencia de Temperatura (ultima hora)"
-    )
-    fig_temp.update_layout(height=400)
+    # Tendencia de temperatura (solo se envian los cambios al navegador)
+    fig_temp, trend_state = build_trend_update(trend_state)
     
     # Velocidad del viento
     fig_wind = px.bar(
@@ -198,15 +362,16 @@ def update_dashboard(n):
     fig_wind.update_layout(height=400)
     
     # Tabla
+    df_weather = get_recent_rows()
     table = dash_table.DataTable(
-        data=df_weather.head(20).to_dict('records'),
+        data=df_weather.to_dict('records'),
         columns=[{"name": i, "id": i} for i in df_weather.columns],
         style_table={'overflowX': 'auto'},
         style_cell={'textAlign': 'left', 'padding': '10px'},
         style_header={'backgroundColor': '#2c3e50', 'color': 'white', 'fontWeight': 'bold'}
     )
     
-    return stats, fig_map, temps, fig_temp, fig_wind, table
+    return stats, fig_map, temps, fig_temp, trend_state, fig_wind, table
 
 if __name__ == '__main__':
     print("\nDashboard corriendo en: http://127.0.0.1:8050/")
@@ -1,70 +1,213 @@
-﻿import psycopg2
-import requests
+﻿import argparse
+import glob
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from datetime import datetime
-from config import DB_CONFIG
+from math import ceil
+import http_client
+from http_client import get_client, request_budget
+from poll_scheduler import PollScheduler, local_time, observation_time
+from reading_spool import ReadingSpool, SPOOL_PATH
+from shards import ShardCoordinator
+from station_models import BANK_DIR
+from station_registry import StationSet, STATION_REFRESH_SECONDS
+from weather_writer import SpoolDrainer, FLUSH_ROWS, FLUSH_SECONDS
 
-# Coordenadas de las ciudades
-CITIES = [
-    {"id": 1, "name": "Santa Marta", "lat": 11.2408, "lon": -74.2120},
-    {"id": 2, "name": "Barranquilla", "lat": 10.9685, "lon": -74.7813},
-    {"id": 3, "name": "Cartagena", "lat": 10.3910, "lon": -75.4794},
-    {"id": 4, "name": "Valledupar", "lat": 10.4631, "lon": -73.2532},
-    {"id": 5, "name": "Riohacha", "lat": 11.5444, "lon": -72.9072},
-    {"id": 6, "name": "Monteria", "lat": 8.7479, "lon": -75.8814},
-    {"id": 7, "name": "Sincelejo", "lat": 9.3047, "lon": -75.3978},
-    {"id": 8, "name": "San Andres", "lat": 12.5847, "lon": -81.7006}
-]
+API_URL = "https://api.open-meteo.com/v1/forecast"
+CURRENT_VARIABLES = "temperature_2m,relative_humidity_2m,pressure_msl,wind_speed_10m,wind_direction_10m,precipitation,cloud_cover,weather_code"
+REQUEST_TIMEOUT = 10  # Segundos maximos por peticion
+MAX_CONCURRENT_REQUESTS = 8  # Peticiones simultaneas a la API (1 = modo secuencial)
+BATCH_SIZE = 50  # Estaciones por peticion multi-ubicacion (1 = una peticion por estacion)
+WAKE_SECONDS = 60  # Maximo entre despertares del streamer (estaciones nuevas y latido del worker)
 
-def fetch_weather_data(lat, lon):
+def fetch_weather_data(lat, lon, api_url=API_URL, timeout=REQUEST_TIMEOUT):
     """Obtener datos del clima desde Open-Meteo API"""
-    url = "https://api.open-meteo.com/v1/forecast"
     params = {
         "latitude": lat,
         "longitude": lon,
-        "current": "temperature_2m,relative_humidity_2m,pressure_msl,wind_speed_10m,wind_direction_10m,precipitation,cloud_cover,weather_code"
+        "current": CURRENT_VARIABLES
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return get_client().get_json(api_url, params=params, timeout=timeout)
     except Exception as e:
         print(f"Error obteniendo datos: {e}")
         return None
 
-def insert_weather_reading(cursor, station_id, data):
-    """Insertar lectura del clima en la base de datos"""
+def fetch_weather_batch(cities, api_url=API_URL, timeout=REQUEST_TIMEOUT, block="current",
+                        variables=CURRENT_VARIABLES, extra_params=None):
+    """Obtener datos de varias ciudades en una sola peticion multi-ubicacion.
+    
+    Open-Meteo acepta listas de coordenadas separadas por comas y responde con
+    un arreglo en el mismo orden. Retorna {station_id: datos} solo para las
+    entradas validas; las demas se reintentan de forma individual.
+    block es el bloque pedido ("current" u "hourly" para pronosticos).
+    """
+    params = {
+        "latitude": ",".join(str(city["lat"]) for city in cities),
+        "longitude": ",".join(str(city["lon"]) for city in cities),
+        block: variables,
+        **(extra_params or {})
+    }
+    
     try:
-        current = data.get("current", {})
-        
-        cursor.execute("""
-            INSERT INTO current_weather 
-            (station_id, temperature, humidity, pressure, wind_speed, wind_direction, 
-             precipitation, cloud_cover, weather_code, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """, (
-            station_id,
-            current.get("temperature_2m"),
-            current.get("relative_humidity_2m"),
-            current.get("pressure_msl"),
-            current.get("wind_speed_10m"),
-            current.get("wind_direction_10m"),
-            current.get("precipitation"),
-            current.get("cloud_cover"),
-            current.get("weather_code"),
-            datetime.now()
-        ))
-        return True
+        # Open-Meteo cuenta cada ubicacion como una llamada de la cuota
+        payload = get_client().get_json(api_url, params=params, timeout=timeout, cost=len(cities))
     except Exception as e:
-        print(f"Error insertando lectura: {e}")
-        return False
+        print(f"Error obteniendo lote de {len(cities)} estaciones: {e}")
+        return {}
+    
+    # Con una sola ubicacion la API responde un objeto en vez de un arreglo
+    if isinstance(payload, dict):
+        payload = [payload]
+    
+    results = {}
+    for city, data in zip(cities, payload):
+        if isinstance(data, dict) and data.get(block):
+            results[city["id"]] = data
+    return results
 
-def stream_weather_data(duration_minutes=5):
-    """Streaming de datos del clima por duracion especificada"""
+def run_fetch_jobs(jobs, max_workers=MAX_CONCURRENT_REQUESTS, timeout=REQUEST_TIMEOUT):
+    """Ejecutar peticiones (clave, etiqueta, funcion, args) con un pool de hilos acotado.
+    
+    Retorna {clave: resultado} de las peticiones que terminaron antes del plazo;
+    las que no responden a tiempo quedan por fuera del ciclo en vez de retrasar al resto.
+    """
+    results = {}
+    if max_workers <= 1:
+        for key, _, func, args in jobs:
+            results[key] = func(*args)
+            time.sleep(0.1)  # Pausa breve entre peticiones
+        return results
+    
+    # Plazo total: una peticion completa (con reintentos y espera por cuota) por cada tanda de max_workers
+    deadline = request_budget(timeout) * ceil(len(jobs) / max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(func, *args): (key, label) for key, label, func, args in jobs}
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        for future in as_completed(futures, timeout=deadline):
+            results[futures[future][0]] = future.result()
+    except FuturesTimeout:
+        pending = [futures[f][1] for f in futures if not f.done()]
+        print(f"Plazo excedido, sin datos para: {', '.join(pending)}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def fetch_all_stations(cities, max_workers=MAX_CONCURRENT_REQUESTS, api_url=API_URL,
+                       timeout=REQUEST_TIMEOUT, batch_size=BATCH_SIZE):
+    """Obtener datos de todas las ciudades, en lotes de batch_size por peticion.
+    
+    Retorna un diccionario {station_id: datos}. Con batch_size=1 se hace una
+    peticion por ciudad.
+    """
+    results = {}
+    pending = cities
+    
+    if batch_size > 1:
+        batches = [cities[i:i + batch_size] for i in range(0, len(cities), batch_size)]
+        jobs = [
+            (n, f"lote {n + 1}", fetch_weather_batch, (batch, api_url, timeout))
+            for n, batch in enumerate(batches)
+        ]
+        for batch_results in run_fetch_jobs(jobs, max_workers, timeout).values():
+            results.update(batch_results)
+        
+        pending = [city for city in cities if city["id"] not in results]
+        if pending:
+            print(f"Reintentando {len(pending)} estaciones de forma individual")
+    
+    jobs = [
+        (city["id"], city["name"], fetch_weather_data, (city["lat"], city["lon"], api_url, timeout))
+        for city in pending
+    ]
+    results.update(run_fetch_jobs(jobs, max_workers, timeout))
+    return results
+
+def build_weather_reading(station_id, data):
+    """Convertir la respuesta de Open-Meteo en una fila para current_weather.
+    
+    El timestamp es la hora de la observacion (current.time) en hora local,
+    no la hora de la descarga.
+    """
+    current = data.get("current", {})
+    observed_at = local_time(observation_time(current["time"])) if current.get("time") else datetime.now()
+    return (
+        station_id,
+        current.get("temperature_2m"),
+        current.get("relative_humidity_2m"),
+        current.get("pressure_msl"),
+        current.get("wind_speed_10m"),
+        current.get("wind_direction_10m"),
+        current.get("precipitation"),
+        current.get("cloud_cover"),
+        current.get("weather_code"),
+        observed_at
+    )
+
+def drain_stranded_spools(coordinator, spool_path=SPOOL_PATH):
+    """Escribir las lecturas pendientes que quedaron en los spools de workers que ya no estan activos.
+
+    Cada worker tiene su propio spool, asi que si uno se retira para siempre sus
+    lecturas quedarian varadas. Los spools de workers con latido reciente no se
+    tocan: su proceso puede estar escribiendo en ellos y los vacia el mismo.
+    """
+    base = spool_path.rsplit('.', 1)[0]
+    paths = {path[len(base) + 1:-len('.jsonl')]: path for path in glob.glob(f"{glob.escape(base)}_*.jsonl")}
+    paths.pop(coordinator.worker_id, None)
+    if not paths:
+        return
+    live = coordinator.live_workers()
+    if live is None:
+        print(f"Spools de otros workers sin revisar: {', '.join(sorted(paths.values()))}")
+        return
+    for other, path in sorted(paths.items()):
+        if other in live:
+            continue
+        spool = ReadingSpool(path)
+        if spool.is_drained():
+            continue
+        print(f"Escribiendo {spool.pending_rows} lecturas pendientes del worker inactivo {other} ({path})")
+        drainer = SpoolDrainer(spool, detect_outliers=False, forecasts=False)
+        drainer.start()
+        drainer.stop()
+        if not spool.is_drained():
+            print(f"   Quedan {spool.pending_rows} lecturas en {path}")
+
+def stream_weather_data(duration_minutes=5, max_workers=MAX_CONCURRENT_REQUESTS, api_url=API_URL,
+                        batch_size=BATCH_SIZE, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS,
+                        spool_path=SPOOL_PATH, station_refresh=STATION_REFRESH_SECONDS, worker_id=None):
+    """Streaming de datos del clima por duracion especificada.
+    
+    Las lecturas se guardan primero en un spool local y un hilo aparte las
+    escribe en PostgreSQL, asi que una caida de la base de datos no detiene
+    la descarga ni pierde datos. Las estaciones activas se leen de
+    weather_stations y se refrescan cada station_refresh segundos.
+    
+    Cada estacion se consulta en su propio plazo absoluto (ver poll_scheduler.py):
+    cuando la API deberia tener una observacion nueva, con un desfase por
+    estacion. Si la observacion no cambio no se escribe nada.
+    
+    Con worker_id el proceso es un worker de un grupo: solo descarga las
+    estaciones de los shards que tiene tomados (ver shards.py). Cada worker
+    usa su propio spool y su propio banco de modelos; al iniciar escribe lo que
+    quedo en los spools de workers inactivos (drain_stranded_spools).
+    """
+    station_set = StationSet(station_refresh)
+    http = http_client.configure(pool_size=max(max_workers, 1))
+    coordinator = None
+    forecast_dir = BANK_DIR
+    if worker_id:
+        coordinator = ShardCoordinator(worker_id)
+        drain_stranded_spools(coordinator, spool_path)
+        spool_path = f"{spool_path.rsplit('.', 1)[0]}_{worker_id}.jsonl"
+        forecast_dir = f"{BANK_DIR}/{worker_id}"
+    spool = ReadingSpool(spool_path)
+    drainer = SpoolDrainer(spool, max_rows=flush_rows, max_age=flush_seconds, forecast_dir=forecast_dir)
+    try:
+        if spool.pending_rows:
+            print(f"Reanudando {spool.pending_rows} lecturas pendientes de {spool_path}")
+        drainer.start()
         
         print(f"\nIniciando streaming de datos climaticos por {duration_minutes} minutos...")
         print("Presiona Ctrl+C para detener\n")
@@ -72,46 +215,80 @@ def stream_weather_data(duration_minutes=5):
         start_time = time.time()
         end_time = start_time + (duration_minutes * 60)
         total_insertions = 0
+        unchanged = 0
+        scheduler = PollScheduler()
+        next_rebalance = start_time
         
         while time.time() < end_time:
-            iteration_start = time.time()
-            successful = 0
-            
-            # Obtener datos de todas las ciudades
-            for city in CITIES:
-                data = fetch_weather_data(city["lat"], city["lon"])
-                if data:
-                    if insert_weather_reading(cursor, city["id"], data):
-                        successful += 1
-                        total_insertions += 1
-                
-                time.sleep(0.1)  # Pausa breve entre peticiones
+            now = time.time()
             
-            conn.commit()
+            # Estaciones activas (en modo worker, solo las de sus shards)
+            cities = station_set.get()
+            if coordinator is not None:
+                if now >= next_rebalance:
+                    shards = coordinator.rebalance()
+                    next_rebalance = now + WAKE_SECONDS
+                    print(f"Worker {coordinator.worker_id}: {len(shards)} shards")
+                cities = [city for city in cities if coordinator.owns(city["id"])]
+            scheduler.sync((city["id"] for city in cities), now)
             
-            # Mostrar estadisticas
-            elapsed = time.time() - start_time
-            remaining = end_time - time.time()
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Insertados: {successful}/{len(CITIES)} | Total: {total_insertions} | Tiempo restante: {int(remaining)}s")
+            due_ids = set(scheduler.due(now))
+            due = [city for city in cities if city["id"] in due_ids]
+            if due:
+                results = fetch_all_stations(due, max_workers=max_workers, api_url=api_url,
+                                             batch_size=batch_size)
+                readings = []
+                for city in due:
+                    data = results.get(city["id"])
+                    if not data:
+                        scheduler.failed(city["id"])
+                    elif scheduler.record(city["id"], data.get("current", {})) is not None:
+                        readings.append(build_weather_reading(city["id"], data))
+                    else:
+                        unchanged += 1
+                spool.append(readings)
+                drainer.notify()
+                total_insertions += len(readings)
+                
+                # Mostrar estadisticas
+                remaining = end_time - time.time()
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Consultadas: {len(due)}/{len(cities)} | Nuevas: {len(readings)} | "
+                      f"Total: {total_insertions} | Escritos: {drainer.writer.total_rows} | Pendientes: {spool.pending_rows} | "
+                      f"Tiempo restante: {int(remaining)}s")
+                metrics = http.metrics()
+                if metrics["retries"] or metrics["rejected"] or metrics["throttled"]:
+                    print(f"   HTTP: reintentos {metrics['retries']} | rechazadas {metrics['rejected']} | "
+                          f"espera por cuota {metrics['throttled_seconds']:.1f}s | circuito {metrics['breaker']}")
             
-            # Esperar hasta completar 1 minuto de ciclo
-            iteration_time = time.time() - iteration_start
-            if iteration_time < 60:
-                time.sleep(60 - iteration_time)
+            # Dormir hasta el siguiente plazo absoluto, sin pasar de WAKE_SECONDS ni del final
+            deadline = scheduler.next_deadline() or end_time
+            wake = min(deadline, now + WAKE_SECONDS, end_time)
+            time.sleep(max(wake - time.time(), 0))
         
-        cursor.close()
-        conn.close()
+        drainer.stop()
         
         print(f"\nStreaming completado!")
-        print(f"Total de registros insertados: {total_insertions}")
+        print(f"Total de registros insertados: {drainer.writer.total_rows}")
         print(f"Promedio: {total_insertions / duration_minutes:.1f} registros por minuto")
+        print(f"Consultas sin observacion nueva (no escritas): {unchanged}")
+        print(f"Throughput de escritura: {drainer.writer.rows_per_second():.0f} filas/s")
+        metrics = http.metrics()
+        print(f"HTTP: {metrics['ok']}/{metrics['requests']} peticiones ok | reintentos: {metrics['retries']} | "
+              f"latencia p50/p95: {metrics['latency_p50'] or 0:.2f}s/{metrics['latency_p95'] or 0:.2f}s")
         
     except KeyboardInterrupt:
         print("\nStreaming detenido por el usuario")
-        conn.close()
+        drainer.stop()
     except Exception as e:
         print(f"Error en streaming: {e}")
+    finally:
+        if coordinator is not None:
+            coordinator.close()
 
 if __name__ == "__main__":
-    # Ejecutar streaming por 5 minutos (puedes cambiar la duracion)
-    stream_weather_data(duration_minutes=5)
+    parser = argparse.ArgumentParser(description="Streaming de datos climaticos de Open-Meteo")
+    parser.add_argument("--minutes", type=float, default=5, help="duracion del streaming")
+    parser.add_argument("--worker-id", help="modo multi-worker: identificador unico de este proceso")
+    args = parser.parse_args()
+    
+    stream_weather_data(duration_minutes=args.minutes, worker_id=args.worker_id)
@@ -0,0 +1,132 @@
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool
+from config import DB_CONFIG
+
+POOL_MIN = 1
+POOL_MAX = 10
+HEALTH_CHECK_AFTER = 30  # Segundos de inactividad antes de verificar una conexion con SELECT 1
+CONNECT_TIMEOUT = 10  # Segundos maximos para abrir una conexion (un servidor que no responde no bloquea el streamer)
+KEEPALIVE_OPTIONS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3
+}
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+_settings = None
+_last_used = {}
+
+def configure(db_config=None, minconn=POOL_MIN, maxconn=POOL_MAX, keepalive=True, statement_timeout_ms=None):
+    """Crear el pool de conexiones compartido.
+
+    Llamarlo de nuevo con la misma configuracion no hace nada; con una
+    configuracion distinta cierra el pool anterior y crea uno nuevo.
+    """
+    global _pool, _slots, _settings
+    settings = dict(db_config or DB_CONFIG)
+    settings.setdefault("connect_timeout", CONNECT_TIMEOUT)
+    if keepalive:
+        for key, value in KEEPALIVE_OPTIONS.items():
+            settings.setdefault(key, value)
+    if statement_timeout_ms:
+        settings["options"] = f"-c statement_timeout={int(statement_timeout_ms)}"
+    settings = (tuple(sorted(settings.items())), minconn, maxconn)
+
+    with _lock:
+        if _pool is not None and settings == _settings:
+            return
+        if _pool is not None:
+            _pool.closeall()
+        _pool = pool.ThreadedConnectionPool(minconn, maxconn, **dict(settings[0]))
+        _slots = threading.BoundedSemaphore(maxconn)
+        _settings = settings
+        _last_used.clear()
+
+def streamlit_db_config(secrets):
+    """Convertir la seccion [database] de st.secrets al formato de DB_CONFIG"""
+    return {
+        'host': secrets["DB_HOST"],
+        'port': secrets["DB_PORT"],
+        'database': secrets["DB_NAME"],
+        'user': secrets["DB_USER"],
+        'password': secrets["DB_PASSWORD"],
+        'sslmode': secrets["DB_SSLMODE"]
+    }
+
+def acquire():
+    """Tomar una conexion sana del pool (espera si todas estan en uso)"""
+    if _pool is None:
+        configure()
+    _slots.acquire()
+    try:
+        conn = _pool.getconn()
+        if conn.closed or not _is_healthy(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    except Exception:
+        _slots.release()
+        raise
+
+def release(conn, discard=False):
+    """Devolver una conexion al pool; discard=True la cierra (por ejemplo tras un error de red)"""
+    try:
+        if not discard and not conn.closed:
+            _last_used[id(conn)] = time.monotonic()
+        else:
+            _last_used.pop(id(conn), None)
+        _pool.putconn(conn, close=discard or bool(conn.closed))
+    finally:
+        _slots.release()
+
+@contextmanager
+def get_connection():
+    """Conexion del pool para un bloque with: commit al salir, rollback si hay error"""
+    conn = acquire()
+    discard = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        discard = _rollback_failed(conn)
+        raise
+    finally:
+        release(conn, discard=discard)
+
+def close_all():
+    """Cerrar todas las conexiones del pool"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def _is_healthy(conn):
+    """Verificar con SELECT 1 las conexiones que llevan un rato sin usarse"""
+    last_used = _last_used.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _rollback_failed(conn):
+    """Deshacer la transaccion; retorna True si la conexion quedo inservible"""
+    if conn.closed:
+        return True
+    try:
+        conn.rollback()
+        return False
+    except psycopg2.Error:
+        return True
@@ -0,0 +1,115 @@
+import argparse
+import csv
+import io
+import time
+from db import get_connection
+from data_streaming import (
+    API_URL, BATCH_SIZE, MAX_CONCURRENT_REQUESTS, REQUEST_TIMEOUT,
+    fetch_weather_batch, run_fetch_jobs
+)
+from poll_scheduler import local_time, observation_time
+from station_registry import get_active_stations
+
+HOURLY_VARIABLES = "temperature_2m,precipitation_probability,weather_code"
+FORECAST_DAYS = 7  # Horizonte pedido a la API (maximo 16)
+FORECAST_SOURCE = 'api'  # Valor de weather_forecasts.source para los pronosticos de Open-Meteo
+
+FORECAST_COLUMNS = ("station_id", "forecast_time", "temperature", "precipitation_prob", "conditions", "source")
+_COLUMNS = ", ".join(FORECAST_COLUMNS)
+
+# Descripcion de los codigos WMO que usa Open-Meteo
+WEATHER_CODES = {
+    0: "Despejado", 1: "Mayormente despejado", 2: "Parcialmente nublado", 3: "Nublado",
+    45: "Niebla", 48: "Niebla con escarcha",
+    51: "Llovizna ligera", 53: "Llovizna", 55: "Llovizna intensa",
+    61: "Lluvia ligera", 63: "Lluvia", 65: "Lluvia intensa",
+    80: "Chubascos ligeros", 81: "Chubascos", 82: "Chubascos violentos",
+    95: "Tormenta", 96: "Tormenta con granizo", 99: "Tormenta con granizo fuerte",
+}
+
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS forecast_batch ON COMMIT DELETE ROWS AS
+    SELECT {_COLUMNS} FROM weather_forecasts WITH NO DATA;
+"""
+
+# Una corrida nueva reemplaza el pronostico anterior de cada hora en vez de duplicarlo
+MERGE_SQL = f"""
+    INSERT INTO weather_forecasts ({_COLUMNS})
+    SELECT DISTINCT ON (station_id, source, forecast_time) {_COLUMNS}
+    FROM forecast_batch
+    ORDER BY station_id, source, forecast_time
+    ON CONFLICT (station_id, source, forecast_time) DO UPDATE SET
+        temperature = EXCLUDED.temperature,
+        precipitation_prob = EXCLUDED.precipitation_prob,
+        conditions = EXCLUDED.conditions,
+        created_at = CURRENT_TIMESTAMP
+    WHERE (weather_forecasts.temperature, weather_forecasts.precipitation_prob, weather_forecasts.conditions)
+        IS DISTINCT FROM (EXCLUDED.temperature, EXCLUDED.precipitation_prob, EXCLUDED.conditions);
+"""
+
+def fetch_forecasts(cities, days=FORECAST_DAYS, max_workers=MAX_CONCURRENT_REQUESTS, api_url=API_URL,
+                    timeout=REQUEST_TIMEOUT, batch_size=BATCH_SIZE):
+    """Pedir el pronostico horario de todas las ciudades en lotes multi-ubicacion; retorna {station_id: datos}"""
+    batches = [cities[i:i + batch_size] for i in range(0, len(cities), batch_size)]
+    extra = {"forecast_days": days}
+    jobs = [
+        (n, f"lote {n + 1}", fetch_weather_batch, (batch, api_url, timeout, "hourly", HOURLY_VARIABLES, extra))
+        for n, batch in enumerate(batches)
+    ]
+    results = {}
+    for batch_results in run_fetch_jobs(jobs, max_workers, timeout).values():
+        results.update(batch_results)
+    return results
+
+def build_forecast_rows(station_id, data, source=FORECAST_SOURCE):
+    """Convertir los arreglos horarios de Open-Meteo en filas para weather_forecasts (hora local)"""
+    hourly = data.get("hourly", {})
+    times = hourly.get("time", [])
+    temperatures = hourly.get("temperature_2m") or [None] * len(times)
+    probabilities = hourly.get("precipitation_probability") or [None] * len(times)
+    codes = hourly.get("weather_code") or [None] * len(times)
+    return [
+        (station_id, local_time(observation_time(ts)), temp, prob, WEATHER_CODES.get(code), source)
+        for ts, temp, prob, code in zip(times, temperatures, probabilities, codes)
+    ]
+
+def write_forecasts(conn, rows):
+    """Cargar las filas con COPY en forecast_batch y fusionarlas en weather_forecasts"""
+    data = io.StringIO()
+    csv.writer(data, lineterminator="\n").writerows(rows)
+    data.seek(0)
+    with conn.cursor() as cursor:
+        cursor.execute(STAGING_SQL)
+        cursor.copy_expert(f"COPY forecast_batch ({_COLUMNS}) FROM STDIN WITH (FORMAT csv)", data)
+        cursor.execute(MERGE_SQL)
+        changed = cursor.rowcount
+    conn.commit()
+    return changed
+
+def ingest_forecasts(cities=None, days=FORECAST_DAYS, max_workers=MAX_CONCURRENT_REQUESTS,
+                     api_url=API_URL, batch_size=BATCH_SIZE):
+    """Descargar y guardar el pronostico horario de todas las estaciones (por defecto las activas)"""
+    try:
+        cities = cities or get_active_stations()
+        start = time.time()
+        results = fetch_forecasts(cities, days, max_workers, api_url, batch_size=batch_size)
+        rows = [row for city in cities if results.get(city["id"])
+                for row in build_forecast_rows(city["id"], results[city["id"]])]
+        print(f"Pronosticos descargados: {len(results)}/{len(cities)} estaciones, {len(rows)} horas")
+
+        if not rows:
+            return
+        with get_connection() as conn:
+            changed = write_forecasts(conn, rows)
+        print(f"Horas nuevas o actualizadas: {changed} | Tiempo total: {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pronostico horario de Open-Meteo en weather_forecasts")
+    parser.add_argument("--days", type=int, default=FORECAST_DAYS, help="dias de horizonte (1-16)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="estaciones por peticion")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_REQUESTS)
+    args = parser.parse_args()
+
+    ingest_forecasts(days=args.days, max_workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,278 @@
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 8  # Conexiones keep-alive por host (igual a MAX_CONCURRENT_REQUESTS de data_streaming)
+# Cuotas del plan gratuito de Open-Meteo: (llamadas, segundos). Cada ubicacion de una peticion cuenta como una llamada
+QUOTAS = ((600, 60), (5000, 3600), (10000, 86400))
+MAX_RETRIES = 3  # Reintentos por peticion ademas del primer intento
+BACKOFF_BASE = 0.5  # Segundos del primer reintento; se duplica en cada intento (con jitter)
+BACKOFF_MAX = 8
+RETRY_BUDGET_RATIO = 0.2  # Reintentos permitidos por peticion en promedio (evita tormentas de reintentos)
+RETRY_BUDGET_MIN = 10  # Reintentos disponibles al arrancar
+BREAKER_FAILURES = 5  # Fallos seguidos que abren el circuito
+BREAKER_RESET_SECONDS = 60  # Tiempo con el circuito abierto antes de dejar pasar una peticion de prueba
+REQUEST_BUDGET_FACTOR = 2  # Tiempo total de una peticion (espera por cuota, intentos y backoff) en multiplos del timeout
+RETRY_STATUS = {429, 500, 502, 503, 504}
+LATENCY_SAMPLES = 1000  # Latencias recientes que se guardan para los percentiles
+
+class CircuitOpenError(requests.RequestException):
+    """El circuito esta abierto: la API fallo muchas veces seguidas y no se le envian peticiones"""
+
+class RateLimitedError(requests.RequestException):
+    """La cuota local no alcanza para la peticion dentro del tiempo de espera permitido"""
+
+class TokenBucket:
+    """Cubeta de tokens: capacity llamadas que se recargan a rate por segundo"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Segundos hasta que haya cost tokens (0 si ya estan)"""
+        self._refill(now)
+        return max(min(cost, self.capacity) - self.tokens, 0) / self.rate
+
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+class RateLimiter:
+    """Varias cubetas (por minuto, hora y dia); una peticion espera a que todas tengan tokens"""
+
+    def __init__(self, quotas=QUOTAS):
+        self.buckets = [TokenBucket(calls, calls / seconds) for calls, seconds in quotas]
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1, max_wait=None):
+        """Reservar cost llamadas; retorna los segundos esperados o lanza RateLimitedError"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                wait = max((bucket.wait_time(cost, time.monotonic()) for bucket in self.buckets), default=0)
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket.take(cost)
+                    return waited
+            if max_wait is not None and waited + wait > max_wait:
+                raise RateLimitedError(f"cuota local agotada (faltan {wait:.0f}s para {cost} llamadas)")
+            time.sleep(wait)
+            waited += wait
+
+class RetryBudget:
+    """Cada peticion deposita ratio tokens y cada reintento gasta uno; sin tokens no se reintenta"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, initial=RETRY_BUDGET_MIN, cap=RETRY_BUDGET_MIN * 10):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = float(initial)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras max_failures fallos seguidos -> medio abierto tras reset_seconds.
+
+    En medio abierto pasa una sola peticion de prueba: si responde se cierra,
+    si falla se abre otra vez.
+    """
+
+    def __init__(self, max_failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "cerrado"
+        return "medio abierto" if time.monotonic() - self.opened_at >= self.reset_seconds else "abierto"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def cancel(self):
+        """La peticion que se dejo pasar no llego a la API (por ejemplo, sin cuota): liberar la prueba"""
+        with self.lock:
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.max_failures:
+                if self.opened_at is None or self.probing:
+                    print(f"Circuito HTTP abierto tras {self.failures} fallos seguidos")
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+class HttpClient:
+    """Cliente HTTP compartido para Open-Meteo.
+
+    Una sola requests.Session con pool de conexiones keep-alive (sin un
+    handshake TLS por peticion), reintentos acotados con backoff exponencial y
+    jitter, limite de cuota local, circuit breaker y metricas de latencia,
+    reintentos y esperas por cuota.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, quotas=QUOTAS, max_retries=MAX_RETRIES,
+                 breaker_failures=BREAKER_FAILURES, breaker_reset=BREAKER_RESET_SECONDS):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = RateLimiter(quotas)
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {"requests": 0, "ok": 0, "errors": 0, "retries": 0, "rejected": 0, "throttled": 0}
+        self.throttled_seconds = 0.0
+
+    def get_json(self, url, params=None, timeout=10, cost=1, total_timeout=None):
+        """GET con reintentos; retorna el JSON o lanza la ultima excepcion.
+
+        cost son las llamadas de cuota que consume la peticion (las ubicaciones
+        de una peticion multi-ubicacion). total_timeout es el tiempo total en segundos
+        para la espera por cuota, los intentos y el backoff (por defecto
+        request_budget(timeout)); ningun intento se alarga mas alla de ese plazo.
+        """
+        self._count("requests")
+        self.budget.deposit()
+        deadline = time.monotonic() + (request_budget(timeout) if total_timeout is None else total_timeout)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(f"circuito {self.breaker.state}: no se consulta {url}")
+            reported = False
+            try:
+                try:
+                    waited = self.limiter.acquire(cost, max_wait=max(deadline - time.monotonic(), 0))
+                except RateLimitedError:
+                    self._count("rejected")
+                    raise
+                if waited:
+                    self._count("throttled", waited)
+
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(url, params=params,
+                                                timeout=max(min(timeout, deadline - time.monotonic()), 0.1))
+                    if response.status_code not in RETRY_STATUS:
+                        response.raise_for_status()
+                        data = response.json()
+                        self.breaker.success()
+                        reported = True
+                        with self.lock:
+                            self.latencies.append(time.perf_counter() - start)
+                            self.counters["ok"] += 1
+                        return data
+                    error = requests.HTTPError(f"{response.status_code} en {url}", response=response)
+                    retry_after = response.headers.get("Retry-After")
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error, retry_after = e, None
+                except requests.RequestException:
+                    # 4xx distinto de 429 o respuesta invalida: reintentar no lo arregla y la API si responde
+                    self.breaker.success()
+                    reported = True
+                    self._count("errors")
+                    raise
+
+                self.breaker.failure()
+                reported = True
+            finally:
+                # Si el intento no llego a la API (cuota, interrupcion) la prueba del circuito queda libre
+                if not reported:
+                    self.breaker.cancel()
+
+            delay = self._backoff(attempt + 1, retry_after)
+            if (attempt >= self.max_retries or time.monotonic() + delay >= deadline
+                    or not self.budget.withdraw()):
+                self._count("errors")
+                raise error
+            attempt += 1
+            self._count("retries")
+            time.sleep(delay)
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full jitter: un valor al azar entre 0 y BACKOFF_BASE * 2^intento (o Retry-After si la API lo pide)"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def _count(self, name, seconds=None):
+        with self.lock:
+            self.counters[name] += 1
+            if seconds:
+                self.throttled_seconds += seconds
+
+    def metrics(self):
+        """Contadores, percentiles de latencia (segundos) y estado del circuito"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = dict(self.counters, throttled_seconds=round(self.throttled_seconds, 3))
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            metrics[f"latency_{name}"] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+        metrics["breaker"] = self.breaker.state
+        return metrics
+
+    def close(self):
+        self.session.close()
+
+def request_budget(timeout):
+    """Tiempo maximo que tarda get_json con este timeout, con reintentos incluidos"""
+    return timeout * REQUEST_BUDGET_FACTOR
+
+_lock = threading.Lock()
+_client = None
+
+def get_client():
+    """Cliente compartido del proceso (se crea en el primer uso)"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+def configure(**options):
+    """Reemplazar el cliente compartido (por ejemplo con otras cuotas o un pool mas grande)"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(**options)
+        return _client
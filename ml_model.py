@@ -1,30 +1,30 @@
-﻿import psycopg2
-import pandas as pd
+﻿import argparse
+import time
 import numpy as np
 from sklearn.linear_model import SGDRegressor
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, r2_score
-from config import DB_CONFIG
-import pickle
-import os
+from db import get_connection
+import model_store
+from reading_horizon import wait_settled_reading_id
+
+FEATURES = ['humidity', 'pressure', 'wind_speed', 'cloud_cover']
+TRAIN_CHUNK_SIZE = 10000  # Filas leidas por bloque del cursor del servidor
+SGD_BATCH_SIZE = 256  # Filas por llamada a partial_fit
 
 class OnlineWeatherPredictor:
     def __init__(self):
         self.model = SGDRegressor(max_iter=1000, tol=1e-3, random_state=42)
         self.scaler = StandardScaler()
         self.is_fitted = False
+        self.last_reading_id = 0  # Marca de agua: ultima lectura usada en el entrenamiento
         
-    def train_incremental(self, X, y):
-        """Entrenamiento incremental (online learning)"""
-        if not self.is_fitted:
-            # Primera vez: fit
-            X_scaled = self.scaler.fit_transform(X)
-            self.model.fit(X_scaled, y)
-            self.is_fitted = True
-        else:
-            # Actualizaciones incrementales: partial_fit
-            X_scaled = self.scaler.transform(X)
-            self.model.partial_fit(X_scaled, y)
+    def train_incremental(self, X, y, batch_size=SGD_BATCH_SIZE):
+        """Entrenamiento incremental (online learning): scaler y modelo con partial_fit"""
+        self.scaler.partial_fit(X)
+        X_scaled = self.scaler.transform(X)
+        for i in range(0, len(X_scaled), batch_size):
+            self.model.partial_fit(X_scaled[i:i+batch_size], y[i:i+batch_size])
+        self.is_fitted = True
     
     def predict(self, X):
         """Prediccion de temperatura"""
@@ -33,95 +33,143 @@ class OnlineWeatherPredictor:
         X_scaled = self.scaler.transform(X)
         return self.model.predict(X_scaled)
     
-    def save_model(self, filepath='weather_model.pkl'):
-        """Guardar modelo"""
-        with open(filepath, 'wb') as f:
-            pickle.dump((self.model, self.scaler, self.is_fitted), f)
+    def save_model(self, model_dir=model_store.MODEL_DIR, **metadata):
+        """Publicar el modelo como una version nueva en el model store; retorna la version"""
+        arrays = {
+            'coef': self.model.coef_,
+            'intercept': self.model.intercept_,
+            'sgd_t': [self.model.t_],
+            'scaler_mean': self.scaler.mean_,
+            'scaler_var': self.scaler.var_,
+            'scaler_scale': self.scaler.scale_,
+            'scaler_samples': [self.scaler.n_samples_seen_],
+        }
+        metadata = dict(metadata, features=FEATURES, last_reading_id=self.last_reading_id)
+        return model_store.save_artifact(arrays, metadata, model_dir)
     
-    def load_model(self, filepath='weather_model.pkl'):
-        """Cargar modelo"""
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                self.model, self.scaler, self.is_fitted = pickle.load(f)
-            return True
-        return False
+    def load_model(self, model_dir=model_store.MODEL_DIR):
+        """Cargar la ultima version del model store para seguir entrenando"""
+        artifact = model_store.load_artifact(model_dir=model_dir)
+        if artifact is None:
+            return False
+        arrays, metadata = artifact
+        # partial_fit continua desde estos atributos igual que tras un entrenamiento en memoria
+        self.model.coef_ = arrays['coef']
+        self.model.intercept_ = arrays['intercept']
+        self.model.t_ = float(arrays['sgd_t'][0])
+        self.model.n_features_in_ = len(FEATURES)
+        self.scaler.mean_ = arrays['scaler_mean']
+        self.scaler.var_ = arrays['scaler_var']
+        self.scaler.scale_ = arrays['scaler_scale']
+        self.scaler.n_samples_seen_ = int(arrays['scaler_samples'][0])
+        self.scaler.n_features_in_ = len(FEATURES)
+        self.is_fitted = True
+        self.last_reading_id = metadata['last_reading_id']
+        return True
 
-def get_training_data():
-    """Obtener datos de entrenamiento"""
-    conn = psycopg2.connect(**DB_CONFIG)
+def iter_training_chunks(since_id=0, chunk_size=TRAIN_CHUNK_SIZE):
+    """Recorrer las lecturas posteriores a since_id en bloques con un cursor del servidor.
+    
+    Genera (reading_ids, X, y) como arreglos NumPy; la memoria usada depende de
+    chunk_size y no del tamano de current_weather. Solo llega hasta el reading_id
+    que ya es definitivo (reading_horizon.py): una lectura con reading_id menor que
+    confirma despues de la marca de agua nunca se entrenaria.
+    """
     query = """
         SELECT 
-            cw.humidity,
-            cw.pressure,
-            cw.wind_speed,
-            cw.cloud_cover,
-            cw.temperature
+            cw.reading_id,
+            cw.humidity::float8,
+            cw.pressure::float8,
+            cw.wind_speed::float8,
+            cw.cloud_cover::float8,
+            cw.temperature::float8
         FROM current_weather cw
-        WHERE cw.humidity IS NOT NULL 
+        WHERE cw.reading_id > %s AND cw.reading_id <= %s
+          AND cw.humidity IS NOT NULL 
           AND cw.pressure IS NOT NULL
           AND cw.wind_speed IS NOT NULL
+          AND cw.cloud_cover IS NOT NULL
           AND cw.temperature IS NOT NULL
-        ORDER BY cw.timestamp;
+        ORDER BY cw.reading_id;
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            until_id = wait_settled_reading_id(cursor)
+        if until_id is None:
+            print("Hay escrituras abiertas desde hace mucho; se entrena en la proxima corrida")
+            return
+        cursor = conn.cursor(name='ml_training_data')
+        cursor.itersize = chunk_size
+        cursor.execute(query, (since_id, until_id))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            data = np.array(rows, dtype=float)
+            yield data[:, 0].astype(np.int64), data[:, 1:5], data[:, 5]
+        cursor.close()
 
-def train_model():
-    """Entrenar modelo con datos actuales"""
-    print("\n=== ENTRENAMIENTO DE MODELO ML ===\n")
-    
-    # Cargar datos
-    df = get_training_data()
-    
-    if len(df) < 10:
-        print(f"No hay suficientes datos para entrenar (solo {len(df)} registros)")
-        return
-    
-    print(f"Datos cargados: {len(df)} registros")
+def train_model(chunk_size=TRAIN_CHUNK_SIZE, batch_size=SGD_BATCH_SIZE, full=False, model_dir=model_store.MODEL_DIR):
+    """Entrenar el modelo en streaming, solo con las lecturas nuevas desde la ultima corrida.
     
-    # Preparar datos
-    X = df[['humidity', 'pressure', 'wind_speed', 'cloud_cover']].values
-    y = df['temperature'].values
-    
-    # Dividir en train/test (80/20)
-    split_idx = int(len(X) * 0.8)
-    X_train, X_test = X[:split_idx], X[split_idx:]
-    y_train, y_test = y[:split_idx], y[split_idx:]
+    Cada bloque se evalua con el modelo actual antes de entrenar con el
+    (evaluacion prequential), asi las metricas no necesitan guardar un conjunto de prueba.
+    """
+    print("\n=== ENTRENAMIENTO DE MODELO ML ===\n")
     
-    # Crear y entrenar modelo
     predictor = OnlineWeatherPredictor()
+    if not full and predictor.load_model(model_dir):
+        print(f"Modelo existente cargado, continuando desde la lectura {predictor.last_reading_id}")
+    
+    start = time.time()
+    n = n_eval = 0
+    abs_error = sq_error = y_sum = y_sq_sum = 0.0
+    examples = []
     
-    # Entrenamiento por mini-batches (simulando streaming)
-    batch_size = 5
-    print(f"\nEntrenando con mini-batches de {batch_size} observaciones...")
+    print(f"Entrenando por bloques de {chunk_size} filas (mini-batches de {batch_size})...")
+    try:
+        for chunk, (reading_ids, X, y) in enumerate(iter_training_chunks(predictor.last_reading_id, chunk_size), 1):
+            if predictor.is_fitted:
+                y_pred = predictor.predict(X)
+                errors = y - y_pred
+                abs_error += np.abs(errors).sum()
+                sq_error += (errors ** 2).sum()
+                y_sum += y.sum()
+                y_sq_sum += (y ** 2).sum()
+                n_eval += len(y)
+                examples = list(zip(y[:5], y_pred[:5]))
+            
+            predictor.train_incremental(X, y, batch_size)
+            predictor.last_reading_id = int(reading_ids[-1])
+            n += len(y)
+            print(f"  Bloque {chunk} procesado ({n} observaciones)")
+    except Exception as e:
+        print(f"Error: {e}")
     
-    for i in range(0, len(X_train), batch_size):
-        batch_X = X_train[i:i+batch_size]
-        batch_y = y_train[i:i+batch_size]
-        predictor.train_incremental(batch_X, batch_y)
-        if (i // batch_size + 1) % 2 == 0:
-            print(f"  Batch {i//batch_size + 1} procesado")
+    if n == 0:
+        print("No hay datos nuevos para entrenar")
+        return
     
-    print(f"\nEntrenamiento completado con {len(X_train)} observaciones")
+    print(f"\nEntrenamiento completado con {n} observaciones en {time.time() - start:.1f}s")
     
     # Evaluar modelo
-    if len(X_test) > 0:
-        y_pred = predictor.predict(X_test)
-        mae = mean_absolute_error(y_test, y_pred)
-        r2 = r2_score(y_test, y_pred)
+    mae = r2 = None
+    if n_eval > 0:
+        mae = abs_error / n_eval
+        ss_tot = y_sq_sum - y_sum ** 2 / n_eval
+        r2 = 1 - sq_error / ss_tot if ss_tot > 0 else float('nan')
         
         print(f"\n=== METRICAS DEL MODELO ===")
         print(f"MAE (Error Absoluto Medio): {mae:.2f}C")
         print(f"R2 Score: {r2:.3f}")
         
         print(f"\n=== PREDICCIONES DE EJEMPLO ===")
-        for i in range(min(5, len(y_test))):
-            print(f"Real: {y_test[i]:.1f}C | Predicho: {y_pred[i]:.1f}C | Error: {abs(y_test[i] - y_pred[i]):.1f}C")
+        for real, pred in examples:
+            print(f"Real: {real:.1f}C | Predicho: {pred:.1f}C | Error: {abs(real - pred):.1f}C")
     
-    # Guardar modelo
-    predictor.save_model()
-    print(f"\nModelo guardado en weather_model.pkl")
+    # Guardar modelo (incluye la marca de agua para la proxima corrida)
+    version = predictor.save_model(model_dir, trained_rows=n, mae=mae, r2=r2)
+    print(f"\nModelo guardado en {model_dir} (version {version})")
     
     # Ejemplo de prediccion nueva
     print(f"\n=== EJEMPLO DE PREDICCION ===")
@@ -131,4 +179,11 @@ def train_model():
     print(f"Temperatura predicha: {prediction[0]:.1f}C")
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Entrenamiento incremental del modelo de temperatura")
+    parser.add_argument("--chunk-size", type=int, default=TRAIN_CHUNK_SIZE, help="filas leidas por bloque")
+    parser.add_argument("--batch-size", type=int, default=SGD_BATCH_SIZE, help="filas por llamada a partial_fit")
+    parser.add_argument("--full", action="store_true", help="ignorar el modelo guardado y entrenar desde cero")
+    parser.add_argument("--model-dir", default=model_store.MODEL_DIR, help="directorio del model store")
+    args = parser.parse_args()
+    
+    train_model(args.chunk_size, args.batch_size, args.full, args.model_dir)
\ No newline at end of file
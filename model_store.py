@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+MODEL_DIR = "models"
+LATEST_FILE = "LATEST"  # Puntero al nombre de la ultima version publicada
+KEEP_VERSIONS = 5  # Versiones anteriores que se conservan en disco
+RELOAD_CHECK_SECONDS = 5  # Cada cuanto ModelWatcher revisa si hay una version nueva
+
+def _artifact_path(version, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"model-{version}.npz")
+
+def _replace_atomic(path, write):
+    """Escribir en un archivo temporal del mismo directorio y reemplazar con os.replace"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_artifact(arrays, metadata, model_dir=MODEL_DIR, keep=KEEP_VERSIONS):
+    """Publicar una version nueva del modelo; retorna el nombre de la version.
+
+    Los arreglos se guardan en un .npz (sin pickle) junto con los metadatos en
+    JSON. El archivo se escribe completo antes de mover el puntero LATEST, asi
+    que un lector nunca ve un modelo a medio escribir.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    metadata = dict(metadata, version=version, created_at=datetime.now().isoformat())
+    payload = {name: np.asarray(value, dtype=float) for name, value in arrays.items()}
+    payload["metadata"] = np.array(json.dumps(metadata, default=str))
+
+    _replace_atomic(_artifact_path(version, model_dir), lambda f: np.savez(f, **payload))
+    _replace_atomic(os.path.join(model_dir, LATEST_FILE), lambda f: f.write(version.encode()))
+    _prune(model_dir, keep)
+    return version
+
+def latest_version(model_dir=MODEL_DIR):
+    """Version publicada actualmente (lectura de un archivo de pocos bytes) o None"""
+    try:
+        with open(os.path.join(model_dir, LATEST_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_artifact(version=None, model_dir=MODEL_DIR):
+    """Leer (arreglos, metadatos) de una version; por defecto la ultima. None si no hay modelo"""
+    version = version or latest_version(model_dir)
+    if version is None:
+        return None
+    with np.load(_artifact_path(version, model_dir), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files if name != "metadata"}
+        metadata = json.loads(str(data["metadata"]))
+    return arrays, metadata
+
+def _prune(model_dir, keep):
+    versions = sorted(
+        name for name in os.listdir(model_dir)
+        if name.startswith("model-") and name.endswith(".npz")
+    )
+    for name in versions[:-keep] if keep else []:
+        os.remove(os.path.join(model_dir, name))
+
+class LinearModel:
+    """Modelo lineal listo para predecir con NumPy: ((X - mean) / scale) @ coef + intercept"""
+
+    def __init__(self, coef, intercept, mean, scale, metadata):
+        self.coef = coef
+        self.intercept = float(np.ravel(intercept)[0])
+        self.mean = mean
+        self.scale = scale
+        self.metadata = metadata
+        self.version = metadata.get("version")
+        self.features = metadata.get("features")
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata):
+        return cls(arrays["coef"], arrays["intercept"], arrays["scaler_mean"], arrays["scaler_scale"], metadata)
+
+    def predict(self, X):
+        """Prediccion de temperatura para una matriz (n, features)"""
+        X = np.asarray(X, dtype=float)
+        return ((X - self.mean) / self.scale) @ self.coef + self.intercept
+
+def load_model(version=None, model_dir=MODEL_DIR):
+    """Cargar un LinearModel (la ultima version por defecto) o None si no hay modelo publicado"""
+    artifact = load_artifact(version, model_dir)
+    if artifact is None:
+        return None
+    return LinearModel.from_artifact(*artifact)
+
+class ModelWatcher:
+    """Mantiene el ultimo modelo en memoria y lo recarga cuando se publica una version nueva.
+
+    get() solo revisa el puntero LATEST cada check_seconds; el resto de las
+    llamadas retornan el modelo ya cargado sin tocar el disco.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, check_seconds=RELOAD_CHECK_SECONDS):
+        self.model_dir = model_dir
+        self.check_seconds = check_seconds
+        self.model = None
+        self.lock = threading.Lock()
+        self._checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return self.model
+        with self.lock:
+            self._checked_at = now
+            version = latest_version(self.model_dir)
+            if version is not None and (self.model is None or self.model.version != version):
+                try:
+                    self.model = load_model(version, self.model_dir)
+                except FileNotFoundError:
+                    # La version se borro entre leer LATEST y abrirla; se reintenta en la proxima revision
+                    self._checked_at = None
+        return self.model
@@ -1,13 +1,22 @@
-﻿import psycopg2
+﻿import argparse
+import math
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from config import DB_CONFIG
+from psycopg2.extras import execute_values
+from db import get_connection
+from reading_horizon import settled_reading_id
+
+TEMP_JUMP_THRESHOLD = 5  # C entre lecturas consecutivas de una estacion
+PRESSURE_ZSCORE_THRESHOLD = 2
+WIND_THRESHOLD = 15  # m/s
+MIN_PRESSURE_SAMPLES = 30  # Lecturas minimas de una estacion antes de evaluar su Z-score
+INCREMENTAL_BATCH = 5000  # Lecturas nuevas procesadas por transaccion
+SCAN_CHUNK_SIZE = 100000  # Filas por bloque en el escaneo historico
+SCAN_EXAMPLES = 5  # Ejemplos impresos por regla en el escaneo historico
 
 def detect_outliers():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        
         query = """
             SELECT 
                 cw.reading_id,
@@ -23,11 +32,11 @@ def detect_outliers():
             ORDER BY cw.timestamp DESC;
         """
         
-        df = pd.read_sql(query, conn)
+        with get_connection() as conn:
+            df = pd.read_sql(query, conn)
         
         if df.empty:
             print("No hay datos suficientes para detectar outliers")
-            conn.close()
             return
         
         print("\n=== SISTEMA DE DETECCION DE OUTLIERS ===\n")
@@ -35,7 +44,7 @@ def detect_outliers():
         outliers_found = []
         
         df['temp_change'] = abs(df['temperature'] - df['prev_temp'])
-        temp_outliers = df[df['temp_change'] > 5]
+        temp_outliers = df[df['temp_change'] > TEMP_JUMP_THRESHOLD]
         
         if not temp_outliers.empty:
             print("ALERTA: Cambios bruscos de temperatura detectados:")
@@ -45,7 +54,7 @@ def detect_outliers():
                 outliers_found.append(msg)
         
         df['pressure_zscore'] = np.abs((df['pressure'] - df['pressure'].mean()) / df['pressure'].std())
-        pressure_outliers = df[df['pressure_zscore'] > 2]
+        pressure_outliers = df[df['pressure_zscore'] > PRESSURE_ZSCORE_THRESHOLD]
         
         if not pressure_outliers.empty:
             print("\nALERTA: Anomalias en presion atmosferica:")
@@ -54,7 +63,7 @@ def detect_outliers():
                 print(msg)
                 outliers_found.append(msg)
         
-        wind_outliers = df[df['wind_speed'] > 15]
+        wind_outliers = df[df['wind_speed'] > WIND_THRESHOLD]
         
         if not wind_outliers.empty:
             print("\nALERTA: Vientos extremos detectados:")
@@ -74,10 +83,407 @@ def detect_outliers():
         if not outliers_found:
             print("\nNo se detectaron anomalias en los datos")
         
-        conn.close()
+    except Exception as e:
+        print(f"Error: {e}")
+
+def create_outlier_tables(cursor):
+    """Crear el estado por estacion, el checkpoint y la tabla de alertas del detector incremental"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outlier_state (
+            station_id INTEGER PRIMARY KEY REFERENCES weather_stations(station_id),
+            pressure_count BIGINT NOT NULL DEFAULT 0,
+            pressure_mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+            pressure_m2 DOUBLE PRECISION NOT NULL DEFAULT 0,
+            prev_temperature DOUBLE PRECISION,
+            prev_timestamp TIMESTAMP
+        );
+        
+        CREATE TABLE IF NOT EXISTS outlier_checkpoint (
+            detector VARCHAR(50) PRIMARY KEY,
+            last_reading_id BIGINT NOT NULL
+        );
+        
+        -- Horizonte de reading_id que espera a que terminen las transacciones abiertas (ver reading_horizon.py)
+        ALTER TABLE outlier_checkpoint ADD COLUMN IF NOT EXISTS pending_reading_id BIGINT;
+        ALTER TABLE outlier_checkpoint ADD COLUMN IF NOT EXISTS pending_xid BIGINT;
+        
+        CREATE TABLE IF NOT EXISTS alerts (
+            alert_id SERIAL PRIMARY KEY,
+            station_id INTEGER REFERENCES weather_stations(station_id),
+            reading_id BIGINT,
+            alert_type VARCHAR(30) NOT NULL,
+            value DOUBLE PRECISION,
+            message TEXT,
+            reading_time TIMESTAMP,
+            source VARCHAR(20) NOT NULL DEFAULT 'streaming',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        ALTER TABLE alerts ADD COLUMN IF NOT EXISTS source VARCHAR(20) NOT NULL DEFAULT 'streaming';
+        CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts(reading_time);
+    """)
+
+def evaluate_reading(state, city, temperature, pressure, wind_speed):
+    """Aplicar las tres reglas a una lectura y actualizar el estado de su estacion.
+    
+    El Z-score de presion se calcula con la media y varianza acumuladas
+    (Welford) de la propia estacion antes de incluir la lectura.
+    """
+    alerts = []
+    
+    if temperature is not None:
+        if state['prev_temperature'] is not None:
+            change = abs(temperature - state['prev_temperature'])
+            if change > TEMP_JUMP_THRESHOLD:
+                alerts.append(('temperature_jump', change, f"{city}: Cambio de {change:.1f}C"))
+        state['prev_temperature'] = temperature
+    
+    if pressure is not None:
+        n = state['pressure_count']
+        if n >= MIN_PRESSURE_SAMPLES:
+            std = math.sqrt(state['pressure_m2'] / (n - 1))
+            if std > 0:
+                zscore = abs(pressure - state['pressure_mean']) / std
+                if zscore > PRESSURE_ZSCORE_THRESHOLD:
+                    alerts.append(('pressure_zscore', zscore,
+                                   f"{city}: Presion anomala de {pressure:.1f} hPa (Z-score: {zscore:.2f})"))
+        n += 1
+        delta = pressure - state['pressure_mean']
+        state['pressure_mean'] += delta / n
+        state['pressure_m2'] += delta * (pressure - state['pressure_mean'])
+        state['pressure_count'] = n
+    
+    if wind_speed is not None and wind_speed > WIND_THRESHOLD:
+        alerts.append(('wind_extreme', wind_speed, f"{city}: Viento de {wind_speed:.1f} m/s"))
+    
+    return alerts
+
+def process_new_readings(conn, batch_size=INCREMENTAL_BATCH, detector='streaming'):
+    """Evaluar las lecturas posteriores al checkpoint y guardar las alertas.
+    
+    Estado, alertas y checkpoint se escriben en la misma transaccion, asi que
+    cada lectura se evalua exactamente una vez. La primera corrida de un detector
+    no reevalua el historial: toma su estado con una consulta (_seed_state) y
+    empieza en el ultimo reading_id definitivo. Solo se leen reading_id que ya
+    no pueden aparecer despues (reading_horizon.py): con varios drainers una
+    lectura con reading_id menor puede confirmar tarde. Retorna (lecturas, alertas).
+    """
+    with conn.cursor() as cursor:
+        # Un solo proceso a la vez por detector (el writer y una ejecucion manual pueden coincidir)
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s));", (f"outliers:{detector}",))
+        if not cursor.fetchone()[0]:
+            conn.rollback()
+            return 0, []
+        try:
+            total_readings, total_alerts = _process_batches(conn, cursor, batch_size, detector)
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (f"outliers:{detector}",))
+            conn.commit()
+    return total_readings, total_alerts
+
+def _process_batches(conn, cursor, batch_size, detector):
+    total_readings = 0
+    total_alerts = []
+    cursor.execute("""
+        SELECT last_reading_id, pending_reading_id, pending_xid FROM outlier_checkpoint WHERE detector = %s;
+    """, (detector,))
+    row = cursor.fetchone()
+    checkpoint = row[0] if row else 0
+    pending = (row[1], row[2]) if row and row[1] is not None else None
+    limit, pending = settled_reading_id(cursor, pending)
+    
+    if row is None and limit is not None:
+        # Primera corrida: el historial no se reevalua, solo se toma su estado por estacion
+        _seed_state(cursor, limit)
+        _save_checkpoint(cursor, detector, limit, pending)
+        conn.commit()
+        return 0, []
+    
+    while limit is not None and checkpoint < limit:
+        cursor.execute("""
+            SELECT cw.reading_id, cw.station_id, ws.city_name, cw.temperature, cw.pressure,
+                   cw.wind_speed, cw.timestamp
+            FROM current_weather cw
+            JOIN weather_stations ws ON cw.station_id = ws.station_id
+            WHERE cw.reading_id > %s AND cw.reading_id <= %s
+            ORDER BY cw.reading_id
+            LIMIT %s;
+        """, (checkpoint, limit, batch_size))
+        readings = cursor.fetchall()
+        if not readings:
+            break
+        
+        station_ids = list({r[1] for r in readings})
+        cursor.execute("""
+            SELECT station_id, pressure_count, pressure_mean, pressure_m2, prev_temperature, prev_timestamp
+            FROM outlier_state WHERE station_id = ANY(%s);
+        """, (station_ids,))
+        states = {
+            r[0]: {'pressure_count': r[1], 'pressure_mean': r[2], 'pressure_m2': r[3],
+                   'prev_temperature': r[4], 'prev_timestamp': r[5]}
+            for r in cursor.fetchall()
+        }
+        
+        alert_rows = []
+        for reading_id, station_id, city, temperature, pressure, wind_speed, timestamp in readings:
+            state = states.setdefault(station_id, {
+                'pressure_count': 0, 'pressure_mean': 0.0, 'pressure_m2': 0.0,
+                'prev_temperature': None, 'prev_timestamp': None
+            })
+            hits = evaluate_reading(
+                state, city,
+                float(temperature) if temperature is not None else None,
+                float(pressure) if pressure is not None else None,
+                float(wind_speed) if wind_speed is not None else None
+            )
+            state['prev_timestamp'] = timestamp
+            for alert_type, value, message in hits:
+                alert_rows.append((station_id, reading_id, alert_type, value, message, timestamp))
+        
+        execute_values(cursor, """
+            INSERT INTO outlier_state
+            (station_id, pressure_count, pressure_mean, pressure_m2, prev_temperature, prev_timestamp)
+            VALUES %s
+            ON CONFLICT (station_id) DO UPDATE SET
+                pressure_count = EXCLUDED.pressure_count,
+                pressure_mean = EXCLUDED.pressure_mean,
+                pressure_m2 = EXCLUDED.pressure_m2,
+                prev_temperature = EXCLUDED.prev_temperature,
+                prev_timestamp = EXCLUDED.prev_timestamp;
+        """, [
+            (sid, st['pressure_count'], st['pressure_mean'], st['pressure_m2'],
+             st['prev_temperature'], st['prev_timestamp'])
+            for sid, st in states.items()
+        ])
+        if alert_rows:
+            execute_values(cursor, """
+                INSERT INTO alerts (station_id, reading_id, alert_type, value, message, reading_time)
+                VALUES %s;
+            """, alert_rows)
+        
+        checkpoint = readings[-1][0]
+        _save_checkpoint(cursor, detector, checkpoint, pending)
+        conn.commit()
+        
+        total_readings += len(readings)
+        total_alerts += [row[4] for row in alert_rows]
+        if len(readings) < batch_size:
+            break
+    
+    if not total_readings:
+        _save_checkpoint(cursor, detector, checkpoint, pending)
+        conn.commit()
+    return total_readings, total_alerts
+
+def _seed_state(cursor, limit):
+    """Estado por estacion (Welford y ultima lectura) de las lecturas hasta limit con una sola consulta.
+
+    La suma de cuadrados M2 de Welford es la varianza muestral por (n - 1).
+    Las alertas del historial las genera scan_outliers_history.
+    """
+    cursor.execute("""
+        INSERT INTO outlier_state
+        (station_id, pressure_count, pressure_mean, pressure_m2, prev_temperature, prev_timestamp)
+        SELECT agg.station_id, agg.pressure_count, agg.pressure_mean, agg.pressure_m2,
+               last_temp.temperature, last_reading.timestamp
+        FROM (
+            SELECT station_id,
+                   COUNT(pressure) AS pressure_count,
+                   COALESCE(AVG(pressure), 0) AS pressure_mean,
+                   COALESCE(VAR_SAMP(pressure) * (COUNT(pressure) - 1), 0) AS pressure_m2
+            FROM current_weather
+            WHERE reading_id <= %(limit)s
+            GROUP BY station_id
+        ) agg
+        JOIN (
+            SELECT DISTINCT ON (station_id) station_id, timestamp
+            FROM current_weather
+            WHERE reading_id <= %(limit)s
+            ORDER BY station_id, reading_id DESC
+        ) last_reading ON last_reading.station_id = agg.station_id
+        LEFT JOIN (
+            SELECT DISTINCT ON (station_id) station_id, temperature
+            FROM current_weather
+            WHERE reading_id <= %(limit)s AND temperature IS NOT NULL
+            ORDER BY station_id, reading_id DESC
+        ) last_temp ON last_temp.station_id = agg.station_id
+        ON CONFLICT (station_id) DO UPDATE SET
+            pressure_count = EXCLUDED.pressure_count,
+            pressure_mean = EXCLUDED.pressure_mean,
+            pressure_m2 = EXCLUDED.pressure_m2,
+            prev_temperature = EXCLUDED.prev_temperature,
+            prev_timestamp = EXCLUDED.prev_timestamp;
+    """, {'limit': limit})
+
+def _save_checkpoint(cursor, detector, checkpoint, pending):
+    pending_reading_id, pending_xid = pending or (None, None)
+    cursor.execute("""
+        INSERT INTO outlier_checkpoint (detector, last_reading_id, pending_reading_id, pending_xid)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (detector) DO UPDATE SET
+            last_reading_id = EXCLUDED.last_reading_id,
+            pending_reading_id = EXCLUDED.pending_reading_id,
+            pending_xid = EXCLUDED.pending_xid;
+    """, (detector, checkpoint, pending_reading_id, pending_xid))
+
+def detect_outliers_incremental():
+    """Procesar solo las lecturas nuevas desde la ultima ejecucion"""
+    try:
+        print("\n=== DETECCION INCREMENTAL DE OUTLIERS ===\n")
+        with get_connection() as conn:
+            processed, alerts = process_new_readings(conn)
+        
+        for msg in alerts:
+            print(f"  - {msg}")
+        print(f"\nLecturas nuevas analizadas: {processed}")
+        print(f"Alertas registradas: {len(alerts)}")
+        
+    except Exception as e:
+        print(f"Error: {e}")
+
+def evaluate_chunk(station_ids, temperatures, pressures, wind_speeds, boundary, pressure_mean, pressure_std):
+    """Aplicar las tres reglas a un bloque ordenado por estacion y tiempo con operaciones NumPy.
+    
+    boundary es (station_id, temperatura) de la ultima fila del bloque anterior,
+    para que el cambio de temperatura no se pierda en el borde entre bloques.
+    Retorna las mascaras y valores de cada regla.
+    """
+    prev_station = np.empty_like(station_ids)
+    prev_station[1:] = station_ids[:-1]
+    prev_temp = np.empty_like(temperatures)
+    prev_temp[1:] = temperatures[:-1]
+    prev_station[0], prev_temp[0] = boundary if boundary is not None else (-1, np.nan)
+    
+    same_station = prev_station == station_ids
+    temp_change = np.where(same_station, np.abs(temperatures - prev_temp), np.nan)
+    with np.errstate(invalid='ignore'):
+        temp_mask = temp_change > TEMP_JUMP_THRESHOLD
+        zscores = np.abs(pressures - pressure_mean) / pressure_std if pressure_std else np.full_like(pressures, np.nan)
+        pressure_mask = zscores > PRESSURE_ZSCORE_THRESHOLD
+        wind_mask = wind_speeds > WIND_THRESHOLD
+    return (temp_mask, temp_change), (pressure_mask, zscores), (wind_mask, wind_speeds)
+
+def scan_outliers_history(chunk_size=SCAN_CHUNK_SIZE, save=False):
+    """Auditoria de todo el historico en bloques de tamano fijo.
+    
+    Lee current_weather con un cursor con nombre (del lado del servidor), asi que
+    la memoria usada depende de chunk_size y no del tamano de la tabla. El
+    Z-score de presion es global, como en detect_outliers, con media y desviacion
+    calculadas en la base de datos. Con save=True las alertas se guardan en
+    alerts (source='audit') con execute_values por bloque.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT station_id, city_name FROM weather_stations;")
+            cities = dict(cursor.fetchall())
+            cursor.execute("""
+                SELECT COUNT(*), AVG(temperature)::float8, MIN(temperature)::float8, MAX(temperature)::float8,
+                       AVG(pressure)::float8, STDDEV_SAMP(pressure)::float8, AVG(wind_speed)::float8
+                FROM current_weather;
+            """)
+            total, temp_avg, temp_min, temp_max, pressure_mean, pressure_std, wind_avg = cursor.fetchone()
+            
+            if not total:
+                print("No hay datos suficientes para detectar outliers")
+                return
+            
+            print(f"\n=== AUDITORIA HISTORICA DE OUTLIERS ({total:,} lecturas, bloques de {chunk_size:,}) ===\n")
+            
+            scan = conn.cursor(name='outlier_history_scan')
+            scan.itersize = chunk_size
+            scan.execute("""
+                SELECT reading_id, station_id, temperature::float8, pressure::float8, wind_speed::float8, timestamp
+                FROM current_weather
+                ORDER BY station_id, timestamp;
+            """)
+            
+            # Mismos mensajes que evaluate_reading; value es el valor de la regla (cambio, Z-score o viento)
+            rules = [
+                ('temperature_jump', "Cambio de {value:.1f}C"),
+                ('pressure_zscore', "Presion anomala de {pressure:.1f} hPa (Z-score: {value:.2f})"),
+                ('wind_extreme', "Viento de {value:.1f} m/s"),
+            ]
+            counts = {name: 0 for name, _ in rules}
+            examples = {name: [] for name, _ in rules}
+            boundary = None
+            processed = 0
+            
+            while True:
+                rows = scan.fetchmany(chunk_size)
+                if not rows:
+                    break
+                reading_ids, station_ids, temperatures, pressures, wind_speeds, timestamps = zip(*rows)
+                station_ids = np.array(station_ids, dtype=np.int64)
+                temperatures = np.array(temperatures, dtype=float)
+                pressures = np.array(pressures, dtype=float)
+                results = evaluate_chunk(
+                    station_ids, temperatures, pressures,
+                    np.array(wind_speeds, dtype=float), boundary, pressure_mean, pressure_std
+                )
+                boundary = (station_ids[-1], temperatures[-1])
+                processed += len(rows)
+                
+                alert_rows = []
+                for (name, template), (mask, values) in zip(rules, results):
+                    hits = np.flatnonzero(mask)
+                    counts[name] += len(hits)
+                    for idx in hits[:max(SCAN_EXAMPLES - len(examples[name]), 0)]:
+                        examples[name].append(
+                            f"{cities.get(int(station_ids[idx]))}: {template.format(value=values[idx], pressure=pressures[idx])}")
+                    if save:
+                        alert_rows += [
+                            (int(station_ids[idx]), reading_ids[idx], name, float(values[idx]),
+                             f"{cities.get(int(station_ids[idx]))}: {template.format(value=values[idx], pressure=pressures[idx])}",
+                             timestamps[idx], 'audit')
+                            for idx in hits
+                        ]
+                if alert_rows:
+                    execute_values(cursor, """
+                        INSERT INTO alerts (station_id, reading_id, alert_type, value, message, reading_time, source)
+                        VALUES %s;
+                    """, alert_rows, page_size=1000)
+                print(f"  Bloque procesado: {processed:,}/{total:,} lecturas")
+            
+            scan.close()
+            cursor.close()
+        
+        titles = {
+            'temperature_jump': "Cambios bruscos de temperatura",
+            'pressure_zscore': "Anomalias en presion atmosferica",
+            'wind_extreme': "Vientos extremos",
+        }
+        for name, _ in rules:
+            if counts[name]:
+                print(f"\nALERTA: {titles[name]}: {counts[name]:,}")
+                for msg in examples[name]:
+                    print(f"  - {msg}")
+        
+        print(f"\n=== ESTADISTICAS ===")
+        print(f"Total de lecturas analizadas: {processed:,}")
+        print(f"Outliers detectados: {sum(counts.values()):,}")
+        print(f"Temperatura promedio: {temp_avg:.1f}C")
+        print(f"Temperatura min/max: {temp_min:.1f}C / {temp_max:.1f}C")
+        print(f"Presion promedio: {pressure_mean:.1f} hPa")
+        print(f"Viento promedio: {wind_avg:.1f} m/s")
         
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    detect_outliers()
+    parser = argparse.ArgumentParser(description="Deteccion de outliers")
+    parser.add_argument("--incremental", action="store_true",
+                        help="procesar solo lecturas nuevas y guardar alertas en la tabla alerts")
+    parser.add_argument("--scan", action="store_true",
+                        help="auditoria de todo el historico en bloques (memoria acotada)")
+    parser.add_argument("--chunk-size", type=int, default=SCAN_CHUNK_SIZE)
+    parser.add_argument("--save", action="store_true", help="con --scan, guardar las alertas en la tabla alerts")
+    args = parser.parse_args()
+    
+    if args.incremental:
+        detect_outliers_incremental()
+    elif args.scan:
+        scan_outliers_history(args.chunk_size, args.save)
+    else:
+        detect_outliers()
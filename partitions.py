@@ -0,0 +1,261 @@
+import argparse
+from datetime import date, timedelta
+from db import get_connection
+
+PARTITION_INTERVAL = 'day'  # 'day' o 'month' (para tablas nuevas; las existentes usan el de sus particiones)
+PARTITIONS_AHEAD = 7  # Particiones futuras que se mantienen creadas
+RETENTION_DAYS = 90  # Antiguedad a partir de la cual se desprenden particiones
+RETENTION_DROP = False  # Borrar las particiones desprendidas (si no, quedan como tablas sueltas para archivarlas)
+
+CURRENT_WEATHER_PARTITIONED = """
+    CREATE TABLE IF NOT EXISTS current_weather (
+        reading_id INTEGER NOT NULL DEFAULT nextval('current_weather_reading_id_seq'),
+        station_id INTEGER REFERENCES weather_stations(station_id),
+        temperature DECIMAL(5, 2),
+        humidity INTEGER,
+        pressure DECIMAL(6, 2),
+        wind_speed DECIMAL(5, 2),
+        wind_direction INTEGER,
+        precipitation DECIMAL(5, 2),
+        cloud_cover INTEGER,
+        weather_code INTEGER,
+        timestamp TIMESTAMP NOT NULL,
+        PRIMARY KEY (reading_id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+
+    ALTER SEQUENCE current_weather_reading_id_seq OWNED BY current_weather.reading_id;
+
+    -- Red de seguridad para lecturas fuera de las particiones existentes
+    CREATE TABLE IF NOT EXISTS current_weather_default PARTITION OF current_weather DEFAULT;
+
+    CREATE INDEX IF NOT EXISTS idx_timestamp ON current_weather(timestamp);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_station_timestamp ON current_weather(station_id, timestamp);
+"""
+
+def partition_start(day, interval=PARTITION_INTERVAL):
+    """Inicio del rango de la particion que contiene day"""
+    return day.replace(day=1) if interval == 'month' else day
+
+def next_partition_start(start, interval=PARTITION_INTERVAL):
+    if interval == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def partition_name(start, interval=PARTITION_INTERVAL):
+    suffix = start.strftime('%Y%m') if interval == 'month' else start.strftime('%Y%m%d')
+    return f"current_weather_p{suffix}"
+
+def parse_partition_name(name):
+    """current_weather_pYYYYMMDD o current_weather_pYYYYMM -> (inicio, intervalo)"""
+    suffix = name.rsplit('_p', 1)[1]
+    if len(suffix) == 8:
+        return date(int(suffix[:4]), int(suffix[4:6]), int(suffix[6:])), 'day'
+    return date(int(suffix[:4]), int(suffix[4:6]), 1), 'month'
+
+def list_partitions(cursor):
+    """Nombres de las particiones por rango de current_weather (sin la default), en orden"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'current_weather'::regclass
+          AND c.relname LIKE 'current_weather\\_p%'
+        ORDER BY c.relname;
+    """)
+    return [name for (name,) in cursor.fetchall()]
+
+def list_detached_partitions(cursor):
+    """Tablas de particiones que la retencion desprendio de current_weather y siguen en la base, en orden"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        WHERE c.relkind = 'r'
+          AND c.relname LIKE 'current_weather\\_p%'
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+        ORDER BY c.relname;
+    """)
+    return [name for (name,) in cursor.fetchall()]
+
+def detect_interval(cursor):
+    """Intervalo de la particion mas reciente ('day' o 'month'), o None si no hay particiones"""
+    latest = max(list_partitions(cursor), key=lambda name: parse_partition_name(name)[0], default=None)
+    return parse_partition_name(latest)[1] if latest else None
+
+def is_partitioned(cursor):
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table
+            WHERE partrelid = to_regclass('current_weather')
+        );
+    """)
+    return cursor.fetchone()[0]
+
+def create_partitioned_table(cursor, interval=PARTITION_INTERVAL, ahead=PARTITIONS_AHEAD):
+    """Crear current_weather particionada por rango de tiempo"""
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS current_weather_reading_id_seq;")
+    cursor.execute(CURRENT_WEATHER_PARTITIONED)
+    return ensure_partitions(cursor, interval=interval, ahead=ahead)
+
+def ensure_partitions(cursor, first_day=None, interval=PARTITION_INTERVAL, ahead=PARTITIONS_AHEAD):
+    """Crear las particiones desde first_day (hoy por defecto) hasta ahead periodos en el futuro"""
+    start = partition_start(first_day or date.today(), interval)
+    last = partition_start(date.today(), interval)
+    for _ in range(ahead):
+        last = next_partition_start(last, interval)
+
+    created = []
+    while start <= last:
+        end = next_partition_start(start, interval)
+        name = partition_name(start, interval)
+        cursor.execute("SELECT to_regclass(%s) IS NULL;", (name,))
+        if cursor.fetchone()[0]:
+            create_partition(cursor, name, start, end)
+            created.append(name)
+        start = end
+    return created
+
+def create_partition(cursor, name, start, end):
+    """Crear la particion [start, end); las lecturas de ese rango que cayeron en la default se pasan a ella"""
+    bounds = {'start': start, 'end': end}
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM current_weather_default WHERE timestamp >= %(start)s AND timestamp < %(end)s
+        );
+    """, bounds)
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"""
+            CREATE TABLE {name} PARTITION OF current_weather
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+        """)
+        return
+    # Postgres no crea la particion si la default ya tiene filas de su rango
+    cursor.execute("""
+        CREATE TEMP TABLE stranded_readings ON COMMIT DROP AS
+        SELECT * FROM current_weather_default WHERE timestamp >= %(start)s AND timestamp < %(end)s;
+
+        DELETE FROM current_weather_default WHERE timestamp >= %(start)s AND timestamp < %(end)s;
+    """, bounds)
+    cursor.execute(f"""
+        CREATE TABLE {name} PARTITION OF current_weather
+        FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+
+        INSERT INTO current_weather SELECT * FROM stranded_readings;
+        DROP TABLE stranded_readings;
+    """)
+
+def apply_retention(cursor, keep_days=RETENTION_DAYS, drop=RETENTION_DROP):
+    """Desprender las particiones que quedaron fuera de la retencion; con drop tambien se borran.
+
+    Las lecturas retiradas se descuentan de station_stats en la misma transaccion.
+    Sin drop las particiones quedan como tablas sueltas; una corrida posterior con
+    drop borra tambien las que se desprendieron antes.
+    """
+    cutoff = date.today() - timedelta(days=keep_days)
+    removed = []
+    if drop:
+        for name in list_detached_partitions(cursor):
+            start, interval_of = parse_partition_name(name)
+            if next_partition_start(start, interval_of) <= cutoff:
+                cursor.execute(f"DROP TABLE {name};")
+                removed.append(name)
+    for name in list_partitions(cursor):
+        start, interval_of = parse_partition_name(name)
+        if next_partition_start(start, interval_of) > cutoff:
+            continue
+        cursor.execute(f"""
+            UPDATE station_stats ss
+            SET reading_count = GREATEST(ss.reading_count - retired.reading_count, 0)
+            FROM (SELECT station_id, COUNT(*) AS reading_count FROM {name} GROUP BY station_id) retired
+            WHERE ss.station_id = retired.station_id;
+        """)
+        cursor.execute(f"ALTER TABLE current_weather DETACH PARTITION {name};")
+        if drop:
+            cursor.execute(f"DROP TABLE {name};")
+        removed.append(name)
+    return removed
+
+def maintain_partitions(conn, interval=None, ahead=PARTITIONS_AHEAD, keep_days=RETENTION_DAYS, drop=RETENTION_DROP):
+    """Crear particiones futuras y aplicar la retencion si la tabla esta particionada.
+
+    Sin interval se usa el de las particiones existentes (el que se eligio al
+    migrar), para no crear particiones diarias que se solapen con una mensual.
+    """
+    with conn.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return [], []
+        interval = interval or detect_interval(cursor) or PARTITION_INTERVAL
+        created = ensure_partitions(cursor, interval=interval, ahead=ahead)
+        removed = apply_retention(cursor, keep_days=keep_days, drop=drop) if keep_days else []
+    conn.commit()
+    return created, removed
+
+def migrate_to_partitioned(interval=PARTITION_INTERVAL, ahead=PARTITIONS_AHEAD, drop_legacy=False):
+    """Convertir la tabla current_weather existente en una tabla particionada.
+
+    La tabla original se renombra a current_weather_legacy, sus filas se copian
+    a la nueva tabla (conservando reading_id y la secuencia; las lecturas repetidas
+    por (station_id, timestamp) se omiten) y, si se pide, se borra.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if is_partitioned(cursor):
+                print("current_weather ya esta particionada")
+                return
+
+            print("Migrando current_weather a tabla particionada...")
+            cursor.execute("""
+                ALTER TABLE current_weather RENAME TO current_weather_legacy;
+                ALTER TABLE current_weather_legacy RENAME CONSTRAINT current_weather_pkey TO current_weather_legacy_pkey;
+                ALTER INDEX IF EXISTS idx_timestamp RENAME TO idx_timestamp_legacy;
+                ALTER INDEX IF EXISTS idx_station_timestamp RENAME TO idx_station_timestamp_legacy;
+            """)
+
+            cursor.execute("SELECT MIN(timestamp)::date FROM current_weather_legacy;")
+            first_day = cursor.fetchone()[0]
+            cursor.execute(CURRENT_WEATHER_PARTITIONED)
+            created = ensure_partitions(cursor, first_day=first_day, interval=interval, ahead=ahead)
+            print(f"Particiones creadas: {len(created)}")
+
+            cursor.execute("""
+                INSERT INTO current_weather
+                SELECT reading_id, station_id, temperature, humidity, pressure, wind_speed,
+                       wind_direction, precipitation, cloud_cover, weather_code, timestamp
+                FROM current_weather_legacy
+                ON CONFLICT (station_id, timestamp) DO NOTHING;
+            """)
+            print(f"Lecturas copiadas: {cursor.rowcount}")
+
+            if drop_legacy:
+                cursor.execute("DROP TABLE current_weather_legacy;")
+                print("Tabla current_weather_legacy eliminada")
+            cursor.close()
+        print("\nMigracion completada!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+def run_maintenance(interval=None, ahead=PARTITIONS_AHEAD, keep_days=RETENTION_DAYS, drop=RETENTION_DROP):
+    try:
+        with get_connection() as conn:
+            created, removed = maintain_partitions(conn, interval=interval, ahead=ahead, keep_days=keep_days, drop=drop)
+        print(f"Particiones creadas: {', '.join(created) or 'ninguna'}")
+        print(f"Particiones retiradas: {', '.join(removed) or 'ninguna'}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de particiones de current_weather")
+    parser.add_argument("--migrate", action="store_true", help="convertir la tabla existente en particionada")
+    parser.add_argument("--drop-legacy", action="store_true", help="borrar la tabla original tras migrar")
+    parser.add_argument("--interval", choices=["day", "month"],
+                        help=f"al migrar: {PARTITION_INTERVAL} por defecto; al mantener: el de las particiones existentes")
+    parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD)
+    parser.add_argument("--keep-days", type=int, default=RETENTION_DAYS, help="0 = sin retencion")
+    parser.add_argument("--drop", action="store_true", default=RETENTION_DROP,
+                        help="borrar las particiones fuera de la retencion en vez de solo desprenderlas")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_to_partitioned(args.interval or PARTITION_INTERVAL, args.ahead, args.drop_legacy)
+    else:
+        run_maintenance(args.interval, args.ahead, args.keep_days, args.drop)
@@ -0,0 +1,92 @@
+import time
+import zlib
+from datetime import datetime, timezone
+
+SOURCE_INTERVAL = 900  # Cadencia de 'current' en Open-Meteo (si la respuesta no trae current.interval)
+PUBLISH_DELAY = 60  # Margen despues del fin del intervalo para que la API publique la observacion nueva
+JITTER_SECONDS = 120  # Ventana en que se reparten las estaciones para no pedirlas todas en el mismo instante
+RETRY_SECONDS = 60  # Espera antes de repetir una estacion sin respuesta o con la misma observacion
+
+def observation_time(value):
+    """Hora de Open-Meteo (ISO en GMT, sin zona) como datetime UTC con zona"""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+def local_time(moment):
+    """datetime con zona -> hora local sin zona, la convencion de las columnas TIMESTAMP del proyecto"""
+    return moment.astimezone().replace(tzinfo=None)
+
+class PollScheduler:
+    """Plazos absolutos de consulta por estacion, alineados con la cadencia de la fuente.
+
+    Open-Meteo solo publica una observacion 'current' nueva cada current.interval
+    segundos (15 minutos), asi que cada estacion se vuelve a pedir cuando deberia
+    existir la siguiente: current.time + interval + PUBLISH_DELAY, mas un desfase
+    fijo por estacion dentro de JITTER_SECONDS. Los plazos son horas epoch, no
+    esperas relativas, y no se corren aunque un ciclo tarde mas de lo previsto.
+    """
+
+    def __init__(self, interval=SOURCE_INTERVAL, publish_delay=PUBLISH_DELAY, jitter=JITTER_SECONDS,
+                 retry=RETRY_SECONDS):
+        self.interval = interval
+        self.publish_delay = publish_delay
+        self.jitter = jitter
+        self.retry = retry
+        self.deadlines = {}  # station_id -> hora epoch de la proxima consulta
+        self.observed = {}  # station_id -> ultima observacion aceptada (datetime UTC)
+
+    def sync(self, station_ids, now=None):
+        """Agregar las estaciones nuevas (se piden de inmediato) y olvidar las que ya no estan"""
+        station_ids = set(station_ids)
+        now = time.time() if now is None else now
+        for station_id in station_ids - self.deadlines.keys():
+            self.deadlines[station_id] = now
+        for station_id in self.deadlines.keys() - station_ids:
+            del self.deadlines[station_id]
+            self.observed.pop(station_id, None)
+
+    def due(self, now=None):
+        """Estaciones cuyo plazo ya se cumplio"""
+        now = time.time() if now is None else now
+        return [station_id for station_id, deadline in self.deadlines.items() if deadline <= now]
+
+    def next_deadline(self):
+        return min(self.deadlines.values(), default=None)
+
+    def offset(self, station_id):
+        """Desfase fijo de la estacion dentro de la ventana de jitter (igual en cada ciclo y proceso).
+
+        Son segundos enteros para que las estaciones del mismo segundo sigan
+        saliendo juntas en peticiones multi-ubicacion.
+        """
+        if not self.jitter:
+            return 0
+        return zlib.crc32(str(station_id).encode()) % self.jitter
+
+    def record(self, station_id, current, now=None):
+        """Registrar el bloque 'current' de una respuesta y programar la siguiente consulta.
+
+        Retorna la hora de la observacion (UTC) si es nueva, o None si es la
+        misma que ya se guardo o la respuesta no trae hora.
+        """
+        now = time.time() if now is None else now
+        try:
+            observed_at = observation_time(current["time"])
+        except (KeyError, TypeError, ValueError):
+            self.failed(station_id, now)
+            return None
+
+        interval = current.get("interval") or self.interval
+        deadline = observed_at.timestamp() + interval + self.publish_delay + self.offset(station_id)
+        # Si la siguiente observacion ya deberia existir y no llego, se repite en poco tiempo
+        self.deadlines[station_id] = deadline if deadline > now else now + self.retry
+
+        last = self.observed.get(station_id)
+        if last is not None and observed_at <= last:
+            return None
+        self.observed[station_id] = observed_at
+        return observed_at
+
+    def failed(self, station_id, now=None):
+        """Sin respuesta valida: repetir la estacion despues de retry segundos"""
+        now = time.time() if now is None else now
+        self.deadlines[station_id] = now + self.retry
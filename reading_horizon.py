@@ -0,0 +1,58 @@
+"""Limite de reading_id hasta el que current_weather ya no puede recibir lecturas nuevas.
+
+Con varios drainers escribiendo a la vez, una transaccion que tomo reading_id
+bajos puede confirmar despues de otra con reading_id mas altos. Un checkpoint
+"reading_id > marca" que ya paso esos valores se saltaria esas lecturas.
+
+El limite se toma en dos pasos: el ultimo valor de la secuencia y despues un
+xid nuevo (pg_current_xact_id). Las transacciones que tomaron esos reading_id ya
+tenian xid (el writer copia a weather_batch antes de insertar) y los xid se
+asignan en orden, asi que todas son menores que el nuevo. Cuando el xmin del
+snapshot actual lo pasa, todas terminaron y las lecturas hasta ese reading_id
+son definitivas.
+"""
+import time
+
+SETTLE_WAIT_SECONDS = 10  # Espera maxima a que terminen las escrituras abiertas (transacciones de un lote)
+
+def take_horizon(cursor):
+    """(ultimo reading_id asignado, xid asignado despues); confirma la transaccion actual de la conexion"""
+    cursor.execute("""
+        SELECT COALESCE(pg_sequence_last_value(pg_get_serial_sequence('current_weather', 'reading_id')::regclass), 0);
+    """)
+    reading_id = cursor.fetchone()[0]
+    # El xmax de un snapshot no sirve: no cuenta los xid asignados despues de la ultima transaccion terminada
+    cursor.execute("SELECT pg_current_xact_id()::text;")
+    xid = int(cursor.fetchone()[0])
+    # Terminar la transaccion para que su propio xid no detenga el xmin
+    cursor.connection.commit()
+    return reading_id, xid
+
+def is_settled(cursor, horizon):
+    """True si ya terminaron todas las transacciones que podian tener reading_id <= horizon[0]"""
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot()) > %s::text::xid8;", (str(horizon[1]),))
+    return cursor.fetchone()[0]
+
+def settled_reading_id(cursor, pending=None):
+    """Retorna (reading_id definitivo o None, horizonte pendiente para la siguiente corrida).
+
+    pending es el horizonte que dejo la corrida anterior. Si sus transacciones
+    siguen abiertas no se avanza. Con un solo writer el horizonte nuevo suele
+    quedar resuelto de inmediato y no hay retraso.
+    """
+    if pending is not None and not is_settled(cursor, pending):
+        return None, pending
+    horizon = take_horizon(cursor)
+    if is_settled(cursor, horizon):
+        return horizon[0], None
+    return (pending[0] if pending is not None else None), horizon
+
+def wait_settled_reading_id(cursor, timeout=SETTLE_WAIT_SECONDS):
+    """Tomar un horizonte nuevo y esperar a que sea definitivo; None si no lo es en timeout segundos"""
+    horizon = take_horizon(cursor)
+    deadline = time.monotonic() + timeout
+    while not is_settled(cursor, horizon):
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
+    return horizon[0]
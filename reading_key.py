@@ -0,0 +1,139 @@
+import argparse
+from db import get_connection
+from rollups import rebuild_rollups
+from station_latest import refresh_station_latest
+
+READING_KEY = ("station_id", "timestamp")  # Clave natural: una observacion por estacion y hora de observacion
+KEY_INDEX = "idx_station_timestamp"
+
+# Lecturas repetidas de la misma clave; se conserva la de menor reading_id (la primera que llego)
+DUPLICATE_KEYS_SQL = """
+    SELECT reading_id, timestamp FROM (
+        SELECT reading_id, timestamp,
+               ROW_NUMBER() OVER (PARTITION BY station_id, timestamp ORDER BY reading_id) AS n
+        FROM current_weather
+    ) ranked
+    WHERE n > 1
+"""
+
+# Lecturas del streamer anterior (cada minuto con datetime.now()) que repiten los valores de la
+# lectura previa de la estacion a menos de 15 minutos, es decir, la misma observacion de Open-Meteo
+MEASUREMENTS = ("temperature", "humidity", "pressure", "wind_speed", "wind_direction",
+                "precipitation", "cloud_cover", "weather_code")
+REPEATED_OBSERVATIONS_SQL = f"""
+    SELECT reading_id, timestamp FROM (
+        SELECT reading_id, timestamp,
+               {" AND ".join(f"{col} IS NOT DISTINCT FROM LAG({col}) OVER w" for col in MEASUREMENTS)} AS same_values,
+               timestamp - LAG(timestamp) OVER w AS gap
+        FROM current_weather
+        WINDOW w AS (PARTITION BY station_id ORDER BY timestamp, reading_id)
+    ) ranked
+    WHERE same_values AND gap < interval '15 minutes'
+"""
+
+def has_reading_key(cursor):
+    """True si current_weather ya tiene el indice unico (station_id, timestamp)"""
+    cursor.execute("""
+        SELECT COALESCE(bool_or(i.indisunique), FALSE)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass('current_weather') AND c.relname = %s;
+    """, (KEY_INDEX,))
+    return cursor.fetchone()[0]
+
+def delete_readings(cursor, selection_sql):
+    """Borrar las lecturas que devuelve selection_sql (reading_id, timestamp) y sus alertas"""
+    cursor.execute(f"""
+        CREATE TEMP TABLE removed_readings AS {selection_sql};
+
+        DELETE FROM alerts a USING removed_readings r WHERE a.reading_id = r.reading_id;
+
+        DELETE FROM current_weather cw
+        USING removed_readings r
+        WHERE cw.reading_id = r.reading_id AND cw.timestamp = r.timestamp;
+    """)
+    removed = cursor.rowcount
+    cursor.execute("DROP TABLE removed_readings;")
+    return removed
+
+def ensure_reading_key(cursor, refresh=True):
+    """Quitar lecturas con la misma (station_id, timestamp) y volver unico idx_station_timestamp.
+
+    No hace nada si el indice ya es unico. current_weather queda bloqueada
+    para escrituras hasta el commit, asi que no entran duplicados nuevos
+    mientras se crea el indice. Si se borraron lecturas y refresh es True se
+    recalculan en la misma transaccion las tablas derivadas. Retorna cuantas
+    lecturas se borraron.
+    """
+    if has_reading_key(cursor):
+        return 0
+    cursor.execute("LOCK TABLE current_weather IN SHARE ROW EXCLUSIVE MODE;")
+    removed = delete_readings(cursor, DUPLICATE_KEYS_SQL)
+    cursor.execute(f"""
+        DROP INDEX IF EXISTS {KEY_INDEX};
+        CREATE UNIQUE INDEX {KEY_INDEX} ON current_weather(station_id, timestamp);
+    """)
+    if removed and refresh:
+        refresh_derived_tables(cursor)
+    return removed
+
+def refresh_station_stats(cursor):
+    """Recontar station_stats despues de borrar lecturas"""
+    cursor.execute("""
+        LOCK TABLE station_stats IN SHARE ROW EXCLUSIVE MODE;
+
+        UPDATE station_stats ss
+        SET reading_count = counts.reading_count, last_reading = counts.last_reading
+        FROM (
+            SELECT station_id, COUNT(*) AS reading_count, MAX(timestamp) AS last_reading
+            FROM current_weather GROUP BY station_id
+        ) counts
+        WHERE ss.station_id = counts.station_id;
+    """)
+
+def refresh_derived_tables(cursor):
+    """Recalcular station_stats, station_latest y los agregados de rollups.py despues de borrar lecturas"""
+    refresh_station_stats(cursor)
+    refresh_station_latest(cursor)
+    rebuild_rollups(cursor)
+
+def migrate_reading_key(collapse_repeats=False, dry_run=False):
+    """Migracion unica: deduplicar current_weather y crear la clave natural (station_id, timestamp).
+
+    Con collapse_repeats tambien se borran las lecturas del streamer anterior
+    que repetian la misma observacion cada minuto (ver REPEATED_OBSERVATIONS_SQL).
+    Al final se recalculan station_stats, station_latest y los agregados de rollups.py.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM current_weather;")
+            total = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM ({DUPLICATE_KEYS_SQL}) d;")
+            duplicates = cursor.fetchone()[0]
+            print(f"Lecturas: {total} | duplicadas por (station_id, timestamp): {duplicates}")
+            if collapse_repeats:
+                cursor.execute(f"SELECT COUNT(*) FROM ({REPEATED_OBSERVATIONS_SQL}) r;")
+                print(f"Observaciones repetidas del streamer anterior: {cursor.fetchone()[0]}")
+            if dry_run:
+                return
+
+            cursor.execute("LOCK TABLE current_weather IN SHARE ROW EXCLUSIVE MODE;")
+            repeats = delete_readings(cursor, REPEATED_OBSERVATIONS_SQL) if collapse_repeats else 0
+            removed = ensure_reading_key(cursor, refresh=False)
+            print(f"Lecturas borradas: {removed + repeats} | indice unico {KEY_INDEX} listo")
+            print("Recalculando station_stats, station_latest y agregados...")
+            refresh_derived_tables(cursor)
+            cursor.close()
+        print("\nMigracion completada!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clave natural (station_id, timestamp) en current_weather")
+    parser.add_argument("--collapse-repeats", action="store_true",
+                        help="borrar tambien las lecturas que repiten la observacion anterior (streamer de 60s)")
+    parser.add_argument("--dry-run", action="store_true", help="solo contar duplicados")
+    args = parser.parse_args()
+
+    migrate_reading_key(args.collapse_repeats, args.dry_run)
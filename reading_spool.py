@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+
+SPOOL_PATH = "weather_spool.jsonl"
+
+class ReadingSpool:
+    """Archivo local append-only con las lecturas pendientes de escribir.
+
+    Cada lectura es una linea JSON. Un archivo .offset guarda hasta que byte
+    ya se escribio en PostgreSQL, asi que despues de una caida o de un corte de
+    la base de datos las lecturas se reanudan en el mismo orden en que llegaron.
+    Las lecturas que la base de datos rechaza por sus datos se apartan en un
+    archivo .rejected para que no detengan a las siguientes.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.reject_path = path + ".rejected"
+        self.lock = threading.Lock()
+        self._repair()
+        self.pending_rows = self._count_pending()
+
+    def append(self, readings):
+        """Agregar lecturas al final del archivo y forzarlas a disco"""
+        if not readings:
+            return
+        lines = "".join(json.dumps(list(reading), default=str) + "\n" for reading in readings)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending_rows += len(readings)
+
+    def read_pending(self, max_rows):
+        """Leer hasta max_rows lecturas pendientes; retorna (lecturas, offset_final)"""
+        with self.lock:
+            offset = self._read_offset()
+            rows = []
+            with open(self.path, "a+", encoding="utf-8") as f:
+                f.seek(offset)
+                while len(rows) < max_rows:
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        break
+                    offset = f.tell()
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        print(f"Linea corrupta en {self.path}, se omite")
+            return rows, offset
+
+    def commit(self, offset, rows):
+        """Marcar como escritas las lecturas hasta offset; compactar si no queda nada"""
+        with self.lock:
+            self.pending_rows = max(self.pending_rows - rows, 0)
+            if offset >= os.path.getsize(self.path):
+                # Todo quedo en la base de datos: se vacia el archivo
+                with open(self.path, "w", encoding="utf-8"):
+                    pass
+                offset = 0
+                self.pending_rows = 0
+            self._write_offset(offset)
+
+    def reject(self, rejected):
+        """Guardar en reject_path las lecturas rechazadas, cada una con su error: [(lectura, error)]"""
+        if not rejected:
+            return
+        lines = "".join(json.dumps({"reading": reading, "error": error}, default=str) + "\n"
+                        for reading, error in rejected)
+        with self.lock:
+            with open(self.reject_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def is_drained(self):
+        return self.pending_rows == 0
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, offset):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def _repair(self):
+        """Descartar una ultima linea incompleta (por ejemplo tras un corte de energia)"""
+        if not os.path.exists(self.path):
+            open(self.path, "w", encoding="utf-8").close()
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+        if self._read_offset() > os.path.getsize(self.path):
+            self._write_offset(0)
+
+    def _count_pending(self):
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset())
+            return sum(1 for _ in f)
@@ -0,0 +1,151 @@
+import argparse
+import pandas as pd
+from db import get_connection
+
+# Variables agregadas (wind_direction y weather_code no tienen un promedio con sentido)
+ROLLUP_VARIABLES = ['temperature', 'humidity', 'pressure', 'wind_speed', 'precipitation', 'cloud_cover']
+
+# granularidad -> (tabla, unidad de date_trunc)
+ROLLUPS = {
+    '1m': ('weather_rollup_1m', 'minute'),
+    '1h': ('weather_rollup_1h', 'hour'),
+    '1d': ('weather_rollup_1d', 'day'),
+}
+
+# Cada nivel se reconstruye a partir del anterior en el backfill
+BACKFILL_SOURCES = {'1m': None, '1h': '1m', '1d': '1h'}
+
+def create_rollup_tables(cursor):
+    """Crear las tablas de agregados por estacion (min/max/suma/conteo por variable)"""
+    columns = ",\n".join(
+        f"{var}_min DOUBLE PRECISION, {var}_max DOUBLE PRECISION, "
+        f"{var}_sum DOUBLE PRECISION NOT NULL DEFAULT 0, {var}_count INTEGER NOT NULL DEFAULT 0"
+        for var in ROLLUP_VARIABLES
+    )
+    for table, _ in ROLLUPS.values():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                station_id INTEGER REFERENCES weather_stations(station_id),
+                bucket TIMESTAMP NOT NULL,
+                reading_count INTEGER NOT NULL,
+                {columns},
+                PRIMARY KEY (station_id, bucket)
+            );
+            CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket);
+        """)
+
+def _conflict_updates(table):
+    updates = [f"reading_count = {table}.reading_count + EXCLUDED.reading_count"]
+    for var in ROLLUP_VARIABLES:
+        updates += [
+            f"{var}_min = LEAST({table}.{var}_min, EXCLUDED.{var}_min)",
+            f"{var}_max = GREATEST({table}.{var}_max, EXCLUDED.{var}_max)",
+            f"{var}_sum = {table}.{var}_sum + EXCLUDED.{var}_sum",
+            f"{var}_count = {table}.{var}_count + EXCLUDED.{var}_count",
+        ]
+    return ",\n                ".join(updates)
+
+def _insert_columns():
+    return ", ".join(
+        ["station_id", "bucket", "reading_count"]
+        + [f"{var}_{agg}" for var in ROLLUP_VARIABLES for agg in ('min', 'max', 'sum', 'count')]
+    )
+
+def rollup_from_readings_sql(granularity, source='weather_batch', where=''):
+    """INSERT ... ON CONFLICT que suma las lecturas crudas de source a un nivel de agregados"""
+    table, unit = ROLLUPS[granularity]
+    aggregates = ", ".join(
+        f"MIN({var}), MAX({var}), COALESCE(SUM({var}), 0), COUNT({var})" for var in ROLLUP_VARIABLES
+    )
+    return f"""
+        INSERT INTO {table} ({_insert_columns()})
+        SELECT station_id, date_trunc('{unit}', timestamp), COUNT(*), {aggregates}
+        FROM {source}
+        {where}
+        GROUP BY 1, 2
+        ON CONFLICT (station_id, bucket) DO UPDATE SET
+                {_conflict_updates(table)};
+    """
+
+def rollup_from_rollup_sql(granularity, source_granularity, where=''):
+    """INSERT ... ON CONFLICT que agrega un nivel fino (por ejemplo 1m) en uno mas grueso"""
+    table, unit = ROLLUPS[granularity]
+    source, _ = ROLLUPS[source_granularity]
+    aggregates = ", ".join(
+        f"MIN({var}_min), MAX({var}_max), SUM({var}_sum), SUM({var}_count)" for var in ROLLUP_VARIABLES
+    )
+    return f"""
+        INSERT INTO {table} ({_insert_columns()})
+        SELECT station_id, date_trunc('{unit}', bucket), SUM(reading_count), {aggregates}
+        FROM {source}
+        {where}
+        GROUP BY 1, 2
+        ON CONFLICT (station_id, bucket) DO UPDATE SET
+                {_conflict_updates(table)};
+    """
+
+def get_rollup(granularity='1h', since=None, station_id=None, until=None):
+    """Leer agregados con promedio por variable; since (incluido), until (excluido) y station_id son opcionales"""
+    table, _ = ROLLUPS[granularity]
+    means = ", ".join(
+        f"r.{var}_min, r.{var}_max, r.{var}_sum / NULLIF(r.{var}_count, 0) AS {var}_mean"
+        for var in ROLLUP_VARIABLES
+    )
+    query = f"""
+        SELECT ws.city_name, r.station_id, r.bucket, r.reading_count, {means}
+        FROM {table} r
+        JOIN weather_stations ws ON r.station_id = ws.station_id
+        WHERE (%(since)s IS NULL OR r.bucket >= %(since)s)
+          AND (%(until)s IS NULL OR r.bucket < %(until)s)
+          AND (%(station_id)s IS NULL OR r.station_id = %(station_id)s)
+        ORDER BY r.bucket, r.station_id;
+    """
+    with get_connection() as conn:
+        df = pd.read_sql(query, conn, params={'since': since, 'until': until, 'station_id': station_id})
+    return df
+
+def rebuild_rollups(cursor, since=None):
+    """Recalcular los agregados desde current_weather en la transaccion del cursor; retorna filas por tabla"""
+    rows = {}
+    for granularity, source in BACKFILL_SOURCES.items():
+        table, unit = ROLLUPS[granularity]
+        # Bloquea las escrituras del writer sobre esta tabla mientras se reconstruye
+        cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE;")
+        if since is None:
+            cursor.execute(f"DELETE FROM {table};")
+            where = ''
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE bucket >= date_trunc('{unit}', %s::timestamp);", (since,))
+            column = 'timestamp' if source is None else 'bucket'
+            where = cursor.mogrify(f"WHERE {column} >= date_trunc('{unit}', %s::timestamp)", (since,)).decode()
+
+        if source is None:
+            cursor.execute(rollup_from_readings_sql(granularity, source='current_weather', where=where))
+        else:
+            cursor.execute(rollup_from_rollup_sql(granularity, source, where=where))
+        rows[table] = cursor.rowcount
+    return rows
+
+def backfill_rollups(since=None):
+    """Recalcular los agregados desde current_weather (todo el historico o desde since)"""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            print("Recalculando agregados por estacion...")
+            for table, count in rebuild_rollups(cursor, since).items():
+                print(f"   - {table}: {count} filas")
+            cursor.close()
+        print("\nAgregados recalculados exitosamente!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agregados por estacion (1 minuto, 1 hora, 1 dia)")
+    parser.add_argument("--backfill", action="store_true", help="recalcular los agregados desde current_weather")
+    parser.add_argument("--since", help="fecha inicial del backfill (YYYY-MM-DD); por defecto todo el historico")
+    args = parser.parse_args()
+
+    if args.backfill:
+        backfill_rollups(args.since)
+    else:
+        parser.print_help()
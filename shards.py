@@ -0,0 +1,185 @@
+import math
+import os
+import socket
+import time
+import zlib
+import psycopg2
+import db
+
+SHARD_COUNT = 64  # Shards virtuales fijos; las estaciones se reparten por hash y los shards entre workers
+HEARTBEAT_TIMEOUT = 150  # Segundos sin latido para considerar caido a un worker (2.5 ciclos)
+STALE_WORKER_SECONDS = 3600  # Antiguedad a partir de la cual se borra la fila de un worker caido
+# Keepalives del lado del servidor en la sesion que tiene los locks: si el host del worker cae o se corta
+# la red, PostgreSQL cierra la sesion y suelta sus shards en ~1 min en vez de las ~2 h del sistema operativo
+SERVER_KEEPALIVE_SETTINGS = {
+    "tcp_keepalives_idle": 30,
+    "tcp_keepalives_interval": 10,
+    "tcp_keepalives_count": 3
+}
+
+def shard_of(station_id, shards=SHARD_COUNT):
+    """Shard fijo de una estacion (crc32, igual en todos los procesos y nodos)"""
+    return zlib.crc32(str(station_id).encode()) % shards
+
+def default_worker_id():
+    return socket.gethostname()
+
+def create_worker_table(cursor):
+    """Tabla de latidos de los workers de ingesta (solo para reparto y monitoreo; la propiedad la dan los locks)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_workers (
+            worker_id VARCHAR(100) PRIMARY KEY,
+            hostname VARCHAR(100),
+            pid INTEGER,
+            shards INTEGER[] NOT NULL DEFAULT '{}',
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            heartbeat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+class ShardCoordinator:
+    """Reparte los shards entre workers con advisory locks de sesion de PostgreSQL.
+
+    Un worker es dueno de un shard mientras su conexion tenga el lock
+    pg_advisory_lock(hashtext('ingest_shard'), shard). Si el proceso muere la
+    conexion se cierra, PostgreSQL suelta sus locks y en el siguiente ciclo otro
+    worker toma esos shards. Si lo que cae es el host o la red, el servidor
+    detecta la sesion muerta con SERVER_KEEPALIVE_SETTINGS. Como un shard solo
+    puede tener un dueno a la vez, dos workers nunca descargan la misma estacion.
+    """
+
+    def __init__(self, worker_id=None, shards=SHARD_COUNT, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.worker_id = worker_id or default_worker_id()
+        self.shards = shards
+        self.heartbeat_timeout = heartbeat_timeout
+        self.owned = set()
+        self.conn = None
+        self.confirmed_at = None  # time.monotonic() del ultimo reparto exitoso
+        # Cada worker recorre los shards desde un punto distinto para no competir por los mismos
+        self._offset = zlib.crc32(self.worker_id.encode()) % shards
+
+    def owns(self, station_id):
+        return shard_of(station_id, self.shards) in self.owned
+
+    def rebalance(self):
+        """Latido + reparto: soltar el excedente, completar la cuota y tomar shards huerfanos.
+
+        Retorna los shards propios. Si la base de datos falla se siguen usando los
+        ultimos shards durante heartbeat_timeout (la descarga no depende de la base
+        de datos y el spool guarda las lecturas); despues otro worker puede tenerlos
+        y se sueltan. Si en ese lapso dos workers piden la misma estacion, la clave
+        (station_id, timestamp) descarta el duplicado.
+        """
+        last_owned = set(self.owned)
+        try:
+            if self.conn is None:
+                self.conn = db.acquire()
+                self.owned = set()
+                with self.conn.cursor() as cursor:
+                    self._set_server_keepalive(cursor)
+            with self.conn.cursor() as cursor:
+                self._heartbeat(cursor)
+                cursor.execute("""
+                    SELECT COUNT(*) FROM ingest_workers
+                    WHERE heartbeat > LOCALTIMESTAMP - %s * interval '1 second';
+                """, (self.heartbeat_timeout,))
+                target = math.ceil(self.shards / max(cursor.fetchone()[0], 1))
+
+                # El excedente solo se suelta hasta cubrir lo que les falta a los otros workers vivos,
+                # para no mover shards de un lado a otro mientras el reparto se estabiliza
+                cursor.execute("""
+                    SELECT COALESCE(SUM(GREATEST(%s - cardinality(shards), 0)), 0) FROM ingest_workers
+                    WHERE heartbeat > LOCALTIMESTAMP - %s * interval '1 second' AND worker_id <> %s;
+                """, (target, self.heartbeat_timeout, self.worker_id))
+                excess = min(max(len(self.owned) - target, 0), cursor.fetchone()[0])
+                released = set(sorted(self.owned)[len(self.owned) - excess:])
+                for shard in released:
+                    cursor.execute("SELECT pg_advisory_unlock(hashtext('ingest_shard'), %s);", (shard,))
+                self.owned -= released
+
+                order = [(self._offset + i) % self.shards for i in range(self.shards)]
+                for shard in order:
+                    if len(self.owned) >= target:
+                        break
+                    if shard not in self.owned and shard not in released and self._try_lock(cursor, shard):
+                        self.owned.add(shard)
+
+                # Shards sin dueno (por ejemplo de un worker que murio y aun figura vivo): se toman
+                # aunque se supere la cuota; el excedente se devuelve en los ciclos siguientes
+                free = [s for s in order if s not in self.owned and s not in released]
+                cursor.execute("""
+                    SELECT shard FROM unnest(%s::int[]) AS shard
+                    WHERE pg_try_advisory_lock(hashtext('ingest_shard'), shard);
+                """, (free,))
+                self.owned.update(shard for (shard,) in cursor.fetchall())
+
+                self._heartbeat(cursor)
+            self.conn.commit()
+            self.confirmed_at = time.monotonic()
+        except psycopg2.Error as e:
+            self._disconnect()
+            if self.confirmed_at is not None and time.monotonic() - self.confirmed_at < self.heartbeat_timeout:
+                self.owned = last_owned
+                print(f"Error coordinando shards: {e}; se siguen usando {len(self.owned)} shards")
+            else:
+                print(f"Error coordinando shards: {e}; sin shards hasta reconectar")
+        return self.owned
+
+    def live_workers(self):
+        """worker_id con latido reciente (incluido este); None si la base de datos no responde"""
+        try:
+            with db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT worker_id FROM ingest_workers
+                        WHERE heartbeat > LOCALTIMESTAMP - %s * interval '1 second';
+                    """, (self.heartbeat_timeout,))
+                    return {worker_id for (worker_id,) in cursor.fetchall()}
+        except psycopg2.Error as e:
+            print(f"Error leyendo los workers activos: {e}")
+            return None
+
+    def close(self):
+        """Soltar los shards y borrar el latido para que otros workers los tomen de inmediato"""
+        if self.conn is None:
+            return
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock_all();")
+                cursor.execute("DELETE FROM ingest_workers WHERE worker_id = %s;", (self.worker_id,))
+            self.conn.commit()
+            db.release(self.conn)
+        except psycopg2.Error:
+            db.release(self.conn, discard=True)
+        self.conn = None
+        self.owned = set()
+
+    def _set_server_keepalive(self, cursor):
+        """Keepalives de la sesion (los de db.KEEPALIVE_OPTIONS solo detectan del lado del cliente)"""
+        for name, value in SERVER_KEEPALIVE_SETTINGS.items():
+            cursor.execute("SELECT set_config(%s, %s, false);", (name, str(value)))
+
+    def _try_lock(self, cursor, shard):
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('ingest_shard'), %s);", (shard,))
+        return cursor.fetchone()[0]
+
+    def _heartbeat(self, cursor):
+        cursor.execute("""
+            INSERT INTO ingest_workers (worker_id, hostname, pid, shards, heartbeat)
+            VALUES (%s, %s, %s, %s, LOCALTIMESTAMP)
+            ON CONFLICT (worker_id) DO UPDATE SET
+                hostname = EXCLUDED.hostname,
+                pid = EXCLUDED.pid,
+                shards = EXCLUDED.shards,
+                heartbeat = EXCLUDED.heartbeat;
+
+            DELETE FROM ingest_workers
+            WHERE heartbeat < LOCALTIMESTAMP - %s * interval '1 second';
+        """, (self.worker_id, socket.gethostname(), os.getpid(), sorted(self.owned), STALE_WORKER_SECONDS))
+
+    def _disconnect(self):
+        """Descartar la conexion; con ella se van los locks, asi que no queda ningun shard confirmado"""
+        if self.conn is not None:
+            db.release(self.conn, discard=True)
+        self.conn = None
+        self.owned = set()
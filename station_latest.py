@@ -0,0 +1,110 @@
+import pandas as pd
+from db import get_connection
+
+LATEST_COLUMNS = [
+    'temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+    'precipitation', 'cloud_cover', 'weather_code', 'timestamp'
+]
+
+# Ultima lectura por estacion; el writer la actualiza en la misma transaccion que current_weather
+STATION_LATEST_UPSERT = f"""
+    INSERT INTO station_latest (station_id, {', '.join(LATEST_COLUMNS)})
+    SELECT DISTINCT ON (station_id) station_id, {', '.join(LATEST_COLUMNS)}
+    FROM weather_batch
+    ORDER BY station_id, timestamp DESC
+    ON CONFLICT (station_id) DO UPDATE SET
+        {', '.join(f'{col} = EXCLUDED.{col}' for col in LATEST_COLUMNS)}
+    WHERE EXCLUDED.timestamp >= station_latest.timestamp;
+"""
+
+# Snapshot actual de todas las estaciones: una fila por estacion sin importar el historico
+STATION_LATEST_QUERY = """
+    SELECT
+        ws.station_id,
+        ws.city_name,
+        ws.department,
+        ws.latitude,
+        ws.longitude,
+        sl.temperature,
+        sl.humidity,
+        sl.pressure,
+        sl.wind_speed,
+        sl.wind_direction,
+        sl.precipitation,
+        sl.cloud_cover,
+        sl.weather_code,
+        sl.timestamp
+    FROM station_latest sl
+    JOIN weather_stations ws ON sl.station_id = ws.station_id
+    ORDER BY ws.city_name
+"""
+
+RECENT_READINGS_LIMIT = 100
+RECENT_WINDOW_HOURS = 6  # Con menos de RECENT_READINGS_LIMIT estaciones: horas hacia atras desde la lectura mas nueva
+
+# Ultimas lecturas de todas las estaciones, acotadas por tiempo con station_latest (una fila por estacion):
+# si hay al menos RECENT_READINGS_LIMIT estaciones, la ultima lectura de la estacion numero LIMIT es un piso
+# exacto (ya hay LIMIT lecturas desde ahi). Con el btree de timestamp es un recorrido hacia atras que para
+# en LIMIT filas
+RECENT_READINGS_QUERY = f"""
+    SELECT
+        ws.city_name,
+        ws.latitude,
+        ws.longitude,
+        cw.temperature,
+        cw.humidity,
+        cw.wind_speed,
+        cw.pressure,
+        cw.cloud_cover,
+        cw.timestamp
+    FROM current_weather cw
+    JOIN weather_stations ws ON cw.station_id = ws.station_id
+    WHERE cw.timestamp >= COALESCE(
+        (SELECT timestamp FROM station_latest ORDER BY timestamp DESC OFFSET {RECENT_READINGS_LIMIT - 1} LIMIT 1),
+        (SELECT MAX(timestamp) FROM station_latest) - interval '{RECENT_WINDOW_HOURS} hours'
+    )
+    ORDER BY cw.timestamp DESC
+    LIMIT {RECENT_READINGS_LIMIT}
+"""
+
+def create_station_latest_table(cursor):
+    """Crear station_latest y llenarla desde current_weather si esta vacia"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS station_latest (
+            station_id INTEGER PRIMARY KEY REFERENCES weather_stations(station_id),
+            temperature DECIMAL(5, 2),
+            humidity INTEGER,
+            pressure DECIMAL(6, 2),
+            wind_speed DECIMAL(5, 2),
+            wind_direction INTEGER,
+            precipitation DECIMAL(5, 2),
+            cloud_cover INTEGER,
+            weather_code INTEGER,
+            timestamp TIMESTAMP NOT NULL
+        );
+
+        INSERT INTO station_latest (station_id, {', '.join(LATEST_COLUMNS)})
+        SELECT DISTINCT ON (station_id) station_id, {', '.join(LATEST_COLUMNS)}
+        FROM current_weather
+        WHERE NOT EXISTS (SELECT 1 FROM station_latest)
+        ORDER BY station_id, timestamp DESC;
+    """)
+
+def refresh_station_latest(cursor):
+    """Reconstruir station_latest desde current_weather (despues de borrar lecturas)"""
+    cursor.execute(f"""
+        LOCK TABLE station_latest IN SHARE ROW EXCLUSIVE MODE;
+
+        DELETE FROM station_latest;
+
+        INSERT INTO station_latest (station_id, {', '.join(LATEST_COLUMNS)})
+        SELECT DISTINCT ON (station_id) station_id, {', '.join(LATEST_COLUMNS)}
+        FROM current_weather
+        ORDER BY station_id, timestamp DESC;
+    """)
+
+def get_station_latest():
+    """Condiciones actuales de todas las estaciones (una fila por estacion)"""
+    with get_connection() as conn:
+        df = pd.read_sql(STATION_LATEST_QUERY, conn)
+    return df
@@ -0,0 +1,207 @@
+import time
+from datetime import timedelta
+import numpy as np
+from psycopg2.extras import execute_values
+import model_store
+
+FEATURES = ['temperature', 'humidity', 'pressure', 'wind_speed', 'cloud_cover']
+FORECAST_HORIZON = timedelta(minutes=15)  # Prediccion para la siguiente observacion (current.interval de Open-Meteo)
+FORECAST_SOURCE = 'station_model'  # Valor de weather_forecasts.source para estas predicciones
+LEARNING_RATE = 0.05  # Paso del LMS normalizado (estable entre 0 y 2)
+BANK_DIR = f"{model_store.MODEL_DIR}/stations"
+SAVE_EVERY_SECONDS = 300  # Cada cuanto se publica el banco en el model store
+
+class StationModelBank:
+    """Un modelo lineal en linea por estacion, guardado como matrices NumPy.
+
+    Cada estacion predice el cambio de temperatura hasta la siguiente lectura a
+    partir de sus variables estandarizadas con su propia media y varianza. La
+    prediccion parte de la persistencia (temperatura actual), asi que una
+    estacion nueva empieza con un pronostico razonable. Predecir para todas las
+    estaciones es una sola operacion matricial y la actualizacion es un paso de
+    LMS normalizado, tambien vectorizado.
+    """
+
+    def __init__(self, n_features=len(FEATURES)):
+        f = n_features
+        self.station_ids = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros((0, f + 1))  # [sesgo, coeficientes] por estacion
+        self.mean = np.zeros((0, f))
+        self.m2 = np.zeros((0, f))
+        self.count = np.zeros(0)
+        self.last_x = np.full((0, f), np.nan)  # Ultima lectura vista, pendiente de su objetivo
+        self.last_time = np.full(0, np.nan)  # Segundos epoch de last_x
+        self._index = {}
+
+    def _rows_for(self, station_ids):
+        """Indice de fila de cada estacion; agrega filas para estaciones nuevas"""
+        new = [sid for sid in dict.fromkeys(station_ids.tolist()) if sid not in self._index]
+        if new:
+            n, f = len(new), self.mean.shape[1]
+            for offset, sid in enumerate(new):
+                self._index[sid] = len(self.station_ids) + offset
+            self.station_ids = np.concatenate([self.station_ids, np.array(new, dtype=np.int64)])
+            self.weights = np.vstack([self.weights, np.zeros((n, f + 1))])
+            self.mean = np.vstack([self.mean, np.zeros((n, f))])
+            self.m2 = np.vstack([self.m2, np.zeros((n, f))])
+            self.count = np.concatenate([self.count, np.zeros(n)])
+            self.last_x = np.vstack([self.last_x, np.full((n, f), np.nan)])
+            self.last_time = np.concatenate([self.last_time, np.full(n, np.nan)])
+        return np.array([self._index[sid] for sid in station_ids.tolist()], dtype=np.int64)
+
+    def _design(self, rows, X):
+        """[1, variables estandarizadas] con la media y varianza de cada estacion"""
+        std = np.sqrt(self.m2[rows] / np.maximum(self.count[rows, None] - 1, 1))
+        z = (X - self.mean[rows]) / np.where(std > 0, std, 1.0)
+        return np.hstack([np.ones((len(rows), 1)), z])
+
+    def _predict_rows(self, rows, X):
+        """Persistencia mas el cambio que predice el modelo de cada fila"""
+        return X[:, 0] + np.einsum('ij,ij->i', self.weights[rows], self._design(rows, X))
+
+    def predict(self, station_ids, X):
+        """Temperatura esperada en la siguiente lectura para cada fila de X, sin modificar el banco.
+
+        Una estacion sin modelo se pronostica con persistencia (su temperatura actual).
+        """
+        rows = np.array([self._index.get(sid, -1) for sid in np.asarray(station_ids).tolist()], dtype=np.int64)
+        known = rows >= 0
+        predictions = np.array(X[:, 0], dtype=float)
+        if known.any():
+            predictions[known] = self._predict_rows(rows[known], X[known])
+        return predictions
+
+    def _partial_fit(self, rows, X):
+        """Un paso de aprendizaje por estacion: last_x de cada una contra su temperatura nueva"""
+        prev = self.last_x[rows]
+        target = X[:, 0] - prev[:, 0]
+        ok = ~np.isnan(prev).any(axis=1) & ~np.isnan(target)
+        if ok.any():
+            r = rows[ok]
+            Z = self._design(r, prev[ok])
+            error = target[ok] - np.einsum('ij,ij->i', self.weights[r], Z)
+            self.weights[r] += LEARNING_RATE * (error / np.einsum('ij,ij->i', Z, Z))[:, None] * Z
+
+        # Media y varianza por estacion (Welford) con las lecturas completas
+        valid = ~np.isnan(X).any(axis=1)
+        r, x = rows[valid], X[valid]
+        self.count[r] += 1
+        delta = x - self.mean[r]
+        self.mean[r] += delta / self.count[r, None]
+        self.m2[r] += delta * (x - self.mean[r])
+
+    def update(self, station_ids, X, times):
+        """Aprender de un lote de lecturas y predecir la siguiente de cada una.
+
+        Un lote puede traer varias lecturas de la misma estacion (por ejemplo al
+        reenviar el atraso del spool); se procesan por rondas en orden de tiempo,
+        con a lo sumo una lectura por estacion en cada ronda.
+        Retorna (station_ids, forecast_times, predicciones) de las filas validas.
+        """
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        times = np.asarray(times, dtype='datetime64[us]')
+        order = np.argsort(times, kind='stable')
+        station_ids, X, times = station_ids[order], X[order], times[order]
+        seconds = times.astype(np.int64) / 1e6
+
+        # Ronda de cada lectura = cuantas lecturas de su estacion van antes en el lote
+        seen = {}
+        rounds = np.empty(len(station_ids), dtype=np.int64)
+        for i, sid in enumerate(station_ids.tolist()):
+            rounds[i] = seen.get(sid, 0)
+            seen[sid] = rounds[i] + 1
+
+        out_ids, out_times, out_pred = [], [], []
+        for k in range(max(seen.values(), default=0)):
+            sel = np.flatnonzero(rounds == k)
+            rows = self._rows_for(station_ids[sel])
+            # Lecturas repetidas o mas viejas que la ultima vista no se aprenden dos veces
+            fresh = ~(seconds[sel] <= self.last_time[rows])
+            sel, rows = sel[fresh], rows[fresh]
+            if not len(sel):
+                continue
+            x = X[sel]
+            self._partial_fit(rows, x)
+            self.last_x[rows] = x
+            self.last_time[rows] = seconds[sel]
+
+            valid = ~np.isnan(x).any(axis=1)
+            if valid.any():
+                out_ids.append(station_ids[sel][valid])
+                out_times.append(times[sel][valid] + np.timedelta64(FORECAST_HORIZON))
+                out_pred.append(self._predict_rows(rows[valid], x[valid]))
+
+        if not out_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype='datetime64[us]'), np.zeros(0)
+        return np.concatenate(out_ids), np.concatenate(out_times), np.concatenate(out_pred)
+
+    def to_arrays(self):
+        return {
+            'station_ids': self.station_ids, 'weights': self.weights, 'mean': self.mean,
+            'm2': self.m2, 'count': self.count, 'last_x': self.last_x, 'last_time': self.last_time,
+        }
+
+    def save(self, model_dir=BANK_DIR):
+        """Publicar el banco como una version nueva en el model store"""
+        return model_store.save_artifact(self.to_arrays(), {'features': FEATURES, 'stations': len(self.station_ids)}, model_dir)
+
+    @classmethod
+    def load(cls, model_dir=BANK_DIR):
+        """Ultima version publicada del banco, o un banco vacio si no hay ninguna"""
+        bank = cls()
+        artifact = model_store.load_artifact(model_dir=model_dir)
+        if artifact is None:
+            return bank
+        arrays, _ = artifact
+        bank.station_ids = arrays['station_ids'].astype(np.int64)
+        for name in ('weights', 'mean', 'm2', 'count', 'last_x', 'last_time'):
+            setattr(bank, name, arrays[name])
+        bank._index = {sid: i for i, sid in enumerate(bank.station_ids.tolist())}
+        return bank
+
+def readings_to_arrays(rows, columns):
+    """(station_ids, X, times) a partir de filas en el orden de columns (None -> nan)"""
+    position = {name: i for i, name in enumerate(columns)}
+    station_ids = np.array([row[position['station_id']] for row in rows], dtype=np.int64)
+    X = np.array([[row[position[name]] for name in FEATURES] for row in rows], dtype=float)
+    times = np.array([row[position['timestamp']] for row in rows], dtype='datetime64[us]')
+    return station_ids, X, times
+
+def write_forecasts(cursor, station_ids, forecast_times, predictions, source=FORECAST_SOURCE):
+    """Guardar las predicciones en weather_forecasts con un solo INSERT ... ON CONFLICT"""
+    if not len(station_ids):
+        return 0
+    rows = [
+        (int(sid), ts.item(), round(float(temp), 2), source)
+        for sid, ts, temp in zip(station_ids, forecast_times, predictions)
+    ]
+    execute_values(cursor, """
+        INSERT INTO weather_forecasts (station_id, forecast_time, temperature, source)
+        VALUES %s
+        ON CONFLICT (station_id, source, forecast_time) DO UPDATE SET
+            temperature = EXCLUDED.temperature,
+            created_at = CURRENT_TIMESTAMP;
+    """, rows, page_size=len(rows))
+    return len(rows)
+
+class ForecastUpdater:
+    """Actualiza el banco con cada lote escrito y guarda sus predicciones (usado por SpoolDrainer)"""
+
+    def __init__(self, model_dir=BANK_DIR, save_every=SAVE_EVERY_SECONDS):
+        self.model_dir = model_dir
+        self.save_every = save_every
+        self.bank = StationModelBank.load(model_dir)
+        self.saved_at = time.monotonic()
+
+    def process(self, conn, rows, columns):
+        station_ids, X, times = readings_to_arrays(rows, columns)
+        with conn.cursor() as cursor:
+            written = write_forecasts(cursor, *self.bank.update(station_ids, X, times))
+        conn.commit()
+        if time.monotonic() - self.saved_at >= self.save_every:
+            self.save()
+        return written
+
+    def save(self):
+        self.bank.save(self.model_dir)
+        self.saved_at = time.monotonic()
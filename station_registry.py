@@ -0,0 +1,155 @@
+import argparse
+import csv
+import json
+import os
+import time
+import psycopg2
+from psycopg2.extras import execute_values
+from db import get_connection
+
+STATIONS_CSV = "stations.csv"
+STATIONS_CACHE = "stations_cache.json"  # Ultimo conjunto leido, para arrancar aunque la base de datos no responda
+STATION_REFRESH_SECONDS = 300  # Cada cuanto el streamer vuelve a leer las estaciones activas
+
+STATION_COLUMNS = ("city_name", "department", "latitude", "longitude", "elevation", "active")
+
+def ensure_registry_schema(cursor):
+    """Agregar la columna active y la clave natural (latitude, longitude) a weather_stations.
+
+    Las filas repetidas que dejaba insert_stations.py (misma ubicacion, sin
+    lecturas) se borran antes de crear el indice unico.
+    """
+    cursor.execute("""
+        ALTER TABLE weather_stations ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE;
+
+        DELETE FROM weather_stations ws
+        USING weather_stations keep
+        WHERE keep.latitude = ws.latitude
+          AND keep.longitude = ws.longitude
+          AND keep.station_id < ws.station_id
+          AND NOT EXISTS (SELECT 1 FROM current_weather cw WHERE cw.station_id = ws.station_id)
+          AND NOT EXISTS (SELECT 1 FROM station_stats ss WHERE ss.station_id = ws.station_id);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_stations_location ON weather_stations(latitude, longitude);
+        CREATE INDEX IF NOT EXISTS idx_stations_active ON weather_stations(station_id) WHERE active;
+    """)
+
+def register_stations(cursor, stations):
+    """Insertar o actualizar estaciones (tuplas en el orden de STATION_COLUMNS) en un solo INSERT.
+
+    La ubicacion identifica a la estacion, asi que registrar el mismo archivo
+    dos veces no crea duplicados. Retorna cuantas filas se insertaron o cambiaron.
+    """
+    if not stations:
+        return 0
+    execute_values(cursor, f"""
+        INSERT INTO weather_stations ({', '.join(STATION_COLUMNS)})
+        VALUES %s
+        ON CONFLICT (latitude, longitude) DO UPDATE SET
+            city_name = EXCLUDED.city_name,
+            department = EXCLUDED.department,
+            elevation = EXCLUDED.elevation,
+            active = EXCLUDED.active
+        WHERE (weather_stations.city_name, weather_stations.department, weather_stations.elevation, weather_stations.active)
+            IS DISTINCT FROM (EXCLUDED.city_name, EXCLUDED.department, EXCLUDED.elevation, EXCLUDED.active);
+    """, stations, page_size=1000)
+    return cursor.rowcount
+
+def read_stations_csv(path=STATIONS_CSV):
+    """Leer estaciones de un CSV con encabezado city_name,department,latitude,longitude,elevation[,active]"""
+    stations = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            active = (row.get("active") or "true").strip().lower() not in ("false", "0", "no")
+            elevation = row.get("elevation") or None
+            stations.append((
+                row["city_name"].strip(),
+                (row.get("department") or "").strip() or None,
+                round(float(row["latitude"]), 6),
+                round(float(row["longitude"]), 6),
+                int(float(elevation)) if elevation else None,
+                active,
+            ))
+    # La ultima fila gana si el archivo repite una ubicacion (ON CONFLICT no admite dos en el mismo INSERT)
+    return list({(s[2], s[3]): s for s in stations}.values())
+
+def register_from_csv(path=STATIONS_CSV):
+    """Registrar (o actualizar) las estaciones de un CSV"""
+    try:
+        stations = read_stations_csv(path)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            ensure_registry_schema(cursor)
+            changed = register_stations(cursor, stations)
+            cursor.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE active) FROM weather_stations;")
+            total, active = cursor.fetchone()
+            cursor.close()
+        print(f"Estaciones en {path}: {len(stations)} | nuevas o actualizadas: {changed}")
+        print(f"Total en la base de datos: {total} ({active} activas)")
+    except Exception as e:
+        print(f"Error: {e}")
+
+def get_active_stations():
+    """Estaciones activas como [{"id", "name", "lat", "lon"}], el formato que usa data_streaming"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT station_id, city_name, latitude::float8, longitude::float8
+            FROM weather_stations
+            WHERE active
+            ORDER BY station_id;
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+    return [{"id": sid, "name": name, "lat": lat, "lon": lon} for sid, name, lat, lon in rows]
+
+class StationSet:
+    """Conjunto de estaciones activas que se relee cada refresh_seconds sin reiniciar el streamer.
+
+    Si la base de datos no responde se sigue usando el ultimo conjunto conocido
+    (en memoria o en cache_path), porque las lecturas igual quedan en el spool.
+    """
+
+    def __init__(self, refresh_seconds=STATION_REFRESH_SECONDS, cache_path=STATIONS_CACHE):
+        self.refresh_seconds = refresh_seconds
+        self.cache_path = cache_path
+        self.stations = []
+        self.loaded_at = None
+
+    def get(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.refresh_seconds:
+            return self.stations
+        self.loaded_at = time.monotonic()
+        try:
+            stations = get_active_stations()
+        except psycopg2.Error as e:
+            if not self.stations:
+                self.stations = self._read_cache()
+            print(f"No se pudieron leer las estaciones ({e}); usando {len(self.stations)} conocidas")
+            return self.stations
+
+        if len(stations) != len(self.stations):
+            print(f"Estaciones activas: {len(stations)}")
+        self.stations = stations
+        self._write_cache(stations)
+        return self.stations
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _write_cache(self, stations):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stations, f)
+        os.replace(tmp_path, self.cache_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registro de estaciones meteorologicas")
+    parser.add_argument("--csv", default=STATIONS_CSV, help="archivo con las estaciones a registrar")
+    args = parser.parse_args()
+
+    register_from_csv(args.csv)
@@ -1,12 +1,17 @@
 import streamlit as st
-import psycopg2
 import pandas as pd
 import plotly.express as px
 import numpy as np
-from sklearn.linear_model import SGDRegressor
-from sklearn.preprocessing import StandardScaler
-import pickle
+import threading
+import time
 from datetime import datetime
+import db
+import model_store
+from ml_model import train_model
+from station_latest import RECENT_READINGS_QUERY, get_station_latest
+
+RETRAIN_SECONDS = 900  # Cada cuánto el hilo de fondo entrena con las lecturas nuevas
+REFRESH_SECONDS = 30  # Intervalo del auto-refresh y vigencia de los datos en caché
 
 st.set_page_config(page_title="Dashboard Climatico Costa Caribe", layout="wide", page_icon="🌤️")
 
@@ -18,77 +23,75 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def init_db_pool():
+    """Crear una sola vez el pool de conexiones compartido por todas las sesiones"""
+    db.configure(db.streamlit_db_config(st.secrets["database"]), statement_timeout_ms=15000)
+
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def load_current_weather():
+    """Últimas lecturas; una sola consulta por intervalo, compartida por todas las sesiones"""
+    init_db_pool()
+    
+    with db.get_connection() as conn:
+        df = pd.read_sql(RECENT_READINGS_QUERY, conn)
+    return df
+
 def get_current_weather():
-    """Obtener datos del clima con conexión fresca"""
+    """Obtener datos del clima desde la caché compartida"""
     try:
-        conn = psycopg2.connect(
-            host=st.secrets["database"]["DB_HOST"],
-            port=st.secrets["database"]["DB_PORT"],
-            database=st.secrets["database"]["DB_NAME"],
-            user=st.secrets["database"]["DB_USER"],
-            password=st.secrets["database"]["DB_PASSWORD"],
-            sslmode=st.secrets["database"]["DB_SSLMODE"]
-        )
-        
-        query = """
-            SELECT 
-                ws.city_name,
-                ws.latitude,
-                ws.longitude,
-                cw.temperature,
-                cw.humidity,
-                cw.wind_speed,
-                cw.pressure,
-                cw.cloud_cover,
-                cw.timestamp
-            FROM current_weather cw
-            JOIN weather_stations ws ON cw.station_id = ws.station_id
-            ORDER BY cw.timestamp DESC
-            LIMIT 100;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-        
+        return load_current_weather()
     except Exception as e:
         st.error(f"Error de conexión: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_resource
-def train_ml_model(df):
-    """Entrenar modelo ML con los datos disponibles"""
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def load_latest_weather():
+    init_db_pool()
+    return get_station_latest()
+
+def get_latest_weather():
+    """Condiciones actuales: una fila por estación desde station_latest"""
     try:
-        # Preparar datos
-        df_clean = df.dropna(subset=['humidity', 'pressure', 'wind_speed', 'cloud_cover', 'temperature'])
-        
-        if len(df_clean) < 10:
-            return None, None, "Datos insuficientes"
-        
-        X = df_clean[['humidity', 'pressure', 'wind_speed', 'cloud_cover']].values
-        y = df_clean['temperature'].values
-        
-        # Crear y entrenar modelo
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        
-        model = SGDRegressor(max_iter=1000, tol=1e-3, random_state=42)
-        model.fit(X_scaled, y)
-        
-        return model, scaler, None
-        
+        return load_latest_weather()
     except Exception as e:
-        return None, None, str(e)
+        st.error(f"Error de conexión: {str(e)}")
+        return pd.DataFrame()
+
+@st.cache_resource
+def start_background_training():
+    """Hilo de fondo que entrena incrementalmente y publica versiones en el model store"""
+    def loop():
+        while True:
+            try:
+                # Usa el pool ya creado por init_db_pool en la sesión que inició el hilo
+                train_model()
+            except Exception as e:
+                print(f"Error: {e}")
+            time.sleep(RETRAIN_SECONDS)
+    
+    thread = threading.Thread(target=loop, name="model-trainer", daemon=True)
+    thread.start()
+    return thread
 
-def predict_temperature(model, scaler, humidity, pressure, wind_speed, cloud_cover):
-    """Hacer predicción de temperatura"""
-    if model is None or scaler is None:
+@st.cache_resource
+def get_model_watcher():
+    """Modelo publicado por ml_model.py; se recarga solo cuando aparece una versión nueva"""
+    return model_store.ModelWatcher()
+
+@st.cache_resource(max_entries=3)
+def load_model_version(version):
+    return model_store.load_model(version)
+
+@st.cache_data(max_entries=1000)
+def predict_temperature(version, humidity, pressure, wind_speed, cloud_cover):
+    """Hacer predicción de temperatura con la versión indicada (solo inferencia, sin entrenar)"""
+    model = load_model_version(version)
+    if model is None:
         return None
     
     features = np.array([[humidity, pressure, wind_speed, cloud_cover]])
-    features_scaled = scaler.transform(features)
-    prediction = model.predict(features_scaled)
-    return prediction[0]
+    return float(model.predict(features)[0])
 
 # ===== TÍTULO Y HEADER =====
 st.title("🌤️ Dashboard Climático Costa Caribe Colombiana")
@@ -97,17 +100,25 @@ st.title("🌤️ Dashboard Climático Costa Caribe Colombiana")
 col_btn1, col_btn2, col_btn3 = st.columns([1, 1, 4])
 with col_btn1:
     if st.button("🔄 Actualizar", use_container_width=True):
+        # Solo los datos: el pool, el modelo y el hilo de entrenamiento se conservan
         st.cache_data.clear()
-        st.cache_resource.clear()
         st.rerun()
         
 with col_btn2:
     auto_refresh = st.checkbox("Auto-refresh")
 
-# ===== OBTENER DATOS =====
-df = get_current_weather()
-
-if not df.empty:
+# ===== SECCIONES =====
+# Cada sección es un fragmento: el temporizador o los widgets de una sección
+# solo vuelven a ejecutar esa sección, no la página completa.
+def render_overview():
+    """Hora de actualización, mapa y temperaturas actuales"""
+    df = get_current_weather()
+    df_unique = get_latest_weather()
+    if df.empty:
+        st.warning("⚠️ No hay datos disponibles en la base de datos.")
+        st.info("💡 Ejecuta `python data_streaming.py` en tu computadora local para generar datos.")
+        return
+    
     # Mostrar hora de última actualización
     last_update = df['timestamp'].max()
     st.markdown(f"<p class='update-time'>📅 Última actualización: {last_update}</p>", unsafe_allow_html=True)
@@ -119,8 +130,6 @@ if not df.empty:
     with col1:
         st.subheader("🗺️ Mapa de Temperaturas")
         
-        df_unique = df.drop_duplicates('city_name')
-        
         fig = px.scatter_mapbox(
             df_unique,
             lat="latitude",
@@ -149,6 +158,12 @@ if not df.empty:
                 value=f"{row['temperature']:.1f}°C",
                 delta=f"{row['humidity']:.0f}% humedad"
             )
+
+def render_predictor():
+    """Predictor interactivo; los sliders solo vuelven a ejecutar este fragmento"""
+    df = get_current_weather()
+    if df.empty:
+        return
     
     # ===== SECCIÓN 2: PREDICCIONES ML INTERACTIVAS =====
     st.markdown("---")
@@ -162,13 +177,17 @@ if not df.empty:
         - **Velocidad del viento** (m/s)
         - **Cobertura de nubes** (%)
         
-        El modelo se entrena con todos los datos históricos disponibles en la base de datos.
+        El modelo se entrena en segundo plano con las lecturas nuevas de la base de datos
+        y la app usa siempre la última versión publicada.
         """)
     
-    # Entrenar modelo
-    model, scaler, error = train_ml_model(df)
+    # El entrenamiento corre fuera de la petición; aquí solo se lee la versión publicada
+    start_background_training()
+    model = get_model_watcher().get()
     
     if model is not None:
+        st.caption(f"Modelo versión {model.version} · {model.metadata.get('trained_rows', 0)} lecturas en el último entrenamiento")
+
         col1, col2, col3 = st.columns(3)
         
         with col1:
@@ -185,7 +204,7 @@ if not df.empty:
         with col3:
             st.markdown("##### 🌡️ Predicción:")
             if st.button("🔮 Predecir Temperatura", use_container_width=True):
-                prediction = predict_temperature(model, scaler, humidity_input, pressure_input, wind_input, cloud_input)
+                prediction = predict_temperature(model.version, humidity_input, pressure_input, wind_input, cloud_input)
                 if prediction is not None:
                     st.markdown(f"<div class='big-metric' style='color: #FF4B4B;'>🌡️ {prediction:.1f}°C</div>", unsafe_allow_html=True)
                     
@@ -204,7 +223,13 @@ if not df.empty:
                     st.write(f"- Viento: {wind_input} m/s")
                     st.write(f"- Nubes: {cloud_input}%")
     else:
-        st.warning("⚠️ No hay suficientes datos para entrenar el modelo. Ejecuta `data_streaming.py` para generar más datos.")
+        st.warning("⚠️ Aún no hay un modelo publicado. Se está entrenando en segundo plano; también puedes ejecutar `python ml_model.py`.")
+
+def render_details():
+    """Anomalías, tabla de lecturas recientes y estadísticas"""
+    df = get_current_weather()
+    if df.empty:
+        return
     
     # ===== SECCIÓN 3: DETECCIÓN DE OUTLIERS =====
     st.markdown("---")
@@ -268,15 +293,8 @@ if not df.empty:
         st.metric("🌡️ Temp. Mínima", f"{df['temperature'].min():.1f}°C")
     
     st.success(f"✅ Dashboard actualizado correctamente con {len(df)} lecturas")
-    
-else:
-    st.warning("⚠️ No hay datos disponibles en la base de datos.")
-    st.info("💡 Ejecuta `python data_streaming.py` en tu computadora local para generar datos.")
-
-# Auto-refresh
-if auto_refresh:
-    import time
-    time.sleep(30)
-    st.rerun()
-
 
+run_every = REFRESH_SECONDS if auto_refresh else None
+st.fragment(render_overview, run_every=run_every)()
+st.fragment(render_predictor)()
+st.fragment(render_details, run_every=run_every)()
@@ -0,0 +1,175 @@
+import pytest
+import requests
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError, HttpClient, RateLimitedError, RateLimiter, TokenBucket
+
+
+class FakeTime:
+    """Reloj manual: sleep avanza monotonic sin esperar"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._data = data or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    """Responde con la lista de resultados en orden (excepciones o respuestas); cada una tarda latency"""
+
+    def __init__(self, results, clock=None, latency=0):
+        self.results = list(results)
+        self.calls = 0
+        self.clock = clock
+        self.latency = latency
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        if self.clock:
+            self.clock.sleep(min(self.latency, timeout))
+        result = self.results.pop(0) if self.results else FakeResponse()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(http_client, "time", fake)
+    monkeypatch.setattr(http_client.random, "uniform", lambda a, b: b)
+    return fake
+
+
+def make_client(results, clock=None, latency=0, **options):
+    client = HttpClient(**options)
+    client.session = FakeSession(results, clock, latency)
+    return client
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(capacity=2, rate=0.5)
+    assert bucket.wait_time(2, clock.now) == 0
+    bucket.take(2)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(2)
+    clock.sleep(1)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1)
+    clock.sleep(10)
+    assert bucket.tokens == pytest.approx(0.5)
+    assert bucket.wait_time(1, clock.now) == 0
+    assert bucket.tokens == 2  # no pasa de la capacidad
+
+
+def test_rate_limiter_waits_for_the_slowest_bucket(clock):
+    limiter = RateLimiter(quotas=((2, 1), (3, 30)))
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(0.5)  # cubeta por segundo
+    assert limiter.acquire() == pytest.approx(9.5)  # cubeta de 30 s: 1 llamada cada 10 s, ya lleva 0.5 s
+
+
+def test_rate_limiter_rejects_beyond_max_wait(clock):
+    limiter = RateLimiter(quotas=((1, 1000),))
+    limiter.acquire()
+    start = clock.now
+    with pytest.raises(RateLimitedError):
+        limiter.acquire(max_wait=5)
+    assert clock.now == start  # no espera si de todas formas no alcanza
+
+
+def test_breaker_opens_after_max_failures_and_probes_after_reset(clock):
+    breaker = CircuitBreaker(max_failures=2, reset_seconds=10)
+    breaker.failure()
+    assert breaker.state == "cerrado"
+    breaker.failure()
+    assert breaker.state == "abierto"
+    assert not breaker.allow()
+
+    clock.sleep(10)
+    assert breaker.state == "medio abierto"
+    assert breaker.allow()
+    assert not breaker.allow()  # una sola peticion de prueba
+    breaker.failure()
+    assert breaker.state == "abierto"
+
+    clock.sleep(10)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "cerrado"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_cancel_releases_the_probe(clock):
+    breaker = CircuitBreaker(max_failures=1, reset_seconds=10)
+    breaker.failure()
+    clock.sleep(10)
+    assert breaker.allow()
+    breaker.cancel()
+    assert breaker.state == "medio abierto"
+    assert breaker.allow()
+
+
+def test_probe_rejected_by_quota_does_not_keep_the_breaker_open(clock):
+    client = make_client([requests.ConnectionError("caida")], quotas=((1, 1000),),
+                         breaker_failures=1, breaker_reset=0.1, max_retries=0)
+    with pytest.raises(requests.ConnectionError):
+        client.get_json("https://api")
+    assert client.breaker.state == "abierto"
+
+    clock.sleep(0.1)
+    with pytest.raises(RateLimitedError):
+        client.get_json("https://api", timeout=1)  # la prueba no consigue cuota
+    assert not client.breaker.probing
+
+    clock.sleep(1000)  # la cuota se recarga
+    assert client.get_json("https://api") == {}
+    assert client.breaker.state == "cerrado"
+    assert client.session.calls == 2
+
+
+def test_retries_with_backoff_until_success(clock):
+    client = make_client([requests.Timeout("lento"), FakeResponse(503), FakeResponse(data={"ok": 1})])
+    assert client.get_json("https://api", timeout=10) == {"ok": 1}
+    metrics = client.metrics()
+    assert metrics["retries"] == 2 and metrics["ok"] == 1 and metrics["errors"] == 0
+    assert client.breaker.failures == 0
+
+
+def test_client_error_is_not_retried(clock):
+    client = make_client([FakeResponse(404)])
+    with pytest.raises(requests.HTTPError):
+        client.get_json("https://api")
+    assert client.session.calls == 1
+    assert client.breaker.state == "cerrado"
+
+
+def test_get_json_stops_retrying_at_the_overall_deadline(clock):
+    client = make_client([requests.Timeout("lento")] * 10, clock=clock, latency=10)
+    start = clock.now
+    with pytest.raises(requests.Timeout):
+        client.get_json("https://api", timeout=10)
+    assert clock.now - start <= http_client.request_budget(10)
+    assert client.session.calls < 1 + client.max_retries
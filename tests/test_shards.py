@@ -0,0 +1,49 @@
+import psycopg2
+import pytest
+import shards
+from shards import ShardCoordinator, shard_of
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(shards, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def db_down(monkeypatch):
+    def acquire():
+        raise psycopg2.OperationalError("timeout expired")
+    monkeypatch.setattr(shards.db, "acquire", acquire)
+
+
+def test_shard_of_is_stable_and_in_range():
+    assert shard_of(123) == shard_of(123)
+    assert all(0 <= shard_of(station_id) < shards.SHARD_COUNT for station_id in range(1000))
+
+
+def test_keeps_last_shards_during_an_outage(clock, db_down):
+    coordinator = ShardCoordinator("w1", heartbeat_timeout=150)
+    coordinator.owned = {3, 7}
+    coordinator.confirmed_at = clock.now
+
+    clock.now += 60
+    assert coordinator.rebalance() == {3, 7}
+    assert coordinator.owns(next(s for s in range(1000) if shard_of(s) == 3))
+
+    clock.now += 90  # 150 s sin confirmar: otro worker ya puede tener esos shards
+    assert coordinator.rebalance() == set()
+
+
+def test_no_shards_without_a_first_successful_rebalance(clock, db_down):
+    coordinator = ShardCoordinator("w1")
+    assert coordinator.rebalance() == set()
@@ -0,0 +1,273 @@
+import csv
+import io
+import threading
+import time
+import psycopg2
+from psycopg2.extras import execute_values
+import db
+from outlier_detection import process_new_readings
+from partitions import maintain_partitions
+from rollups import ROLLUPS, rollup_from_readings_sql
+from station_latest import STATION_LATEST_UPSERT
+from station_models import BANK_DIR, ForecastUpdater
+
+READING_COLUMNS = (
+    "station_id", "temperature", "humidity", "pressure", "wind_speed", "wind_direction",
+    "precipitation", "cloud_cover", "weather_code", "timestamp"
+)
+FLUSH_ROWS = 500  # Lecturas pendientes en el spool que disparan una escritura (y tamano de cada lote)
+FLUSH_SECONDS = 60  # Espera maxima (segundos) del drainer entre escrituras
+BACKOFF_INITIAL = 1  # Espera (segundos) antes del primer reintento de conexion
+BACKOFF_MAX = 300  # Espera maxima entre reintentos
+PARTITION_CHECK_SECONDS = 3600  # Cada cuanto se crean particiones futuras y se aplica la retencion
+INLINE_OUTLIER_DETECTION = True  # Evaluar outliers de las lecturas nuevas despues de cada escritura
+INLINE_FORECASTS = True  # Actualizar el banco de modelos por estacion y guardar sus pronosticos
+# Errores por los datos de una lectura (no de la conexion): reintentar el mismo lote no sirve
+DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+_COLUMNS = ", ".join(READING_COLUMNS)
+
+# Tabla temporal de la sesion donde COPY carga cada lote
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS weather_batch ON COMMIT DELETE ROWS AS
+    SELECT {_COLUMNS} FROM current_weather WITH NO DATA;
+"""
+
+# Pasos que pasan el lote de weather_batch a las tablas finales, en la misma transaccion.
+# Los dos primeros dejan en weather_batch solo las lecturas que de verdad se insertaron
+# (clave natural station_id, timestamp; ver reading_key.py), asi que reintentos y
+# reenvios del spool no se cuentan dos veces en station_stats ni en los agregados.
+MERGE_STEPS = [
+    """
+    DELETE FROM weather_batch a
+    USING weather_batch b
+    WHERE a.station_id = b.station_id AND a.timestamp = b.timestamp AND a.ctid > b.ctid;
+    """,
+    f"""
+    WITH inserted AS (
+        INSERT INTO current_weather ({_COLUMNS})
+        SELECT {_COLUMNS} FROM weather_batch
+        ON CONFLICT (station_id, timestamp) DO NOTHING
+        RETURNING station_id, timestamp
+    )
+    DELETE FROM weather_batch wb
+    WHERE NOT EXISTS (
+        SELECT 1 FROM inserted i WHERE i.station_id = wb.station_id AND i.timestamp = wb.timestamp
+    );
+    """,
+    """
+    INSERT INTO station_stats (station_id, reading_count, last_reading)
+    SELECT station_id, COUNT(*), MAX(timestamp) FROM weather_batch GROUP BY station_id
+    ON CONFLICT (station_id) DO UPDATE SET
+        reading_count = station_stats.reading_count + EXCLUDED.reading_count,
+        last_reading = GREATEST(station_stats.last_reading, EXCLUDED.last_reading);
+    """,
+    STATION_LATEST_UPSERT,
+] + [rollup_from_readings_sql(granularity) for granularity in ROLLUPS] + [
+    "SELECT COUNT(*) FROM weather_batch;"
+]
+
+class WeatherWriter:
+    """Escritura de lecturas en current_weather por lotes.
+
+    Cada escritura carga el lote en una tabla temporal con COPY FROM STDIN (un
+    solo viaje de red por lote; execute_values como respaldo) y luego ejecuta
+    MERGE_STEPS, que insertan en current_weather y actualizan station_stats,
+    station_latest y los agregados de rollups.py. Las lecturas que ya estaban
+    (misma estacion y timestamp) se descartan y se cuentan en skipped_rows.
+    Las lecturas son tuplas en el orden de READING_COLUMNS.
+    """
+
+    def __init__(self, conn, use_copy=True):
+        self.conn = conn
+        self.use_copy = use_copy
+        self.total_rows = 0
+        self.skipped_rows = 0
+        self.total_seconds = 0.0
+
+    def write_rows(self, rows):
+        """Escribir un lote de lecturas en una transaccion; retorna las que se insertaron"""
+        start = time.perf_counter()
+        with self.conn.cursor() as cursor:
+            cursor.execute(STAGING_SQL)
+            if self.use_copy:
+                try:
+                    self._copy_rows(cursor, rows)
+                except (psycopg2.NotSupportedError, psycopg2.ProgrammingError) as e:
+                    print(f"COPY no disponible ({e}), usando execute_values")
+                    self.conn.rollback()
+                    self.use_copy = False
+                    cursor.execute(STAGING_SQL)
+            if not self.use_copy:
+                self._insert_rows(cursor, rows)
+            cursor.execute("".join(MERGE_STEPS))
+            inserted = cursor.fetchone()[0]
+        self.conn.commit()
+        elapsed = time.perf_counter() - start
+
+        self.total_rows += inserted
+        self.skipped_rows += len(rows) - inserted
+        self.total_seconds += elapsed
+        return inserted
+
+    def rows_per_second(self):
+        """Throughput promedio de escritura (lecturas procesadas por segundo) desde que se creo el writer"""
+        processed = self.total_rows + self.skipped_rows
+        return processed / self.total_seconds if self.total_seconds > 0 else 0.0
+
+    def _copy_rows(self, cursor, rows):
+        data = io.StringIO()
+        csv.writer(data, lineterminator="\n").writerows(rows)
+        data.seek(0)
+        cursor.copy_expert(f"COPY weather_batch ({_COLUMNS}) FROM STDIN WITH (FORMAT csv)", data)
+
+    def _insert_rows(self, cursor, rows):
+        execute_values(
+            cursor,
+            f"INSERT INTO weather_batch ({_COLUMNS}) VALUES %s",
+            rows,
+            page_size=len(rows)
+        )
+
+
+class SpoolDrainer(threading.Thread):
+    """Hilo que vacia un ReadingSpool hacia PostgreSQL.
+
+    La descarga de datos solo escribe en el spool; este hilo se encarga de la
+    conexion, reconecta con backoff exponencial si la base de datos no responde
+    y reenvia el atraso en lotes de max_rows, en orden. Un lote que la base de
+    datos rechaza por sus datos se escribe fila por fila y las filas invalidas
+    pasan al archivo .rejected del spool, para que no bloqueen el offset.
+    """
+
+    def __init__(self, spool, max_rows=FLUSH_ROWS, max_age=FLUSH_SECONDS, detect_outliers=INLINE_OUTLIER_DETECTION,
+                 forecasts=INLINE_FORECASTS, forecast_dir=BANK_DIR):
+        super().__init__(name="spool-drainer", daemon=True)
+        self.spool = spool
+        self.detect_outliers = detect_outliers
+        self.forecaster = ForecastUpdater(forecast_dir) if forecasts else None
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.writer = WeatherWriter(None)
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.last_maintenance = None
+
+    def notify(self):
+        """Pedir una escritura inmediata si el spool ya alcanzo max_rows"""
+        if self.spool.pending_rows >= self.max_rows:
+            self.wake.set()
+
+    def stop(self, timeout=None):
+        """Vaciar lo pendiente (si la base de datos responde) y terminar"""
+        self.stopping.set()
+        self.wake.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self.forecaster is not None:
+            self.forecaster.save()
+
+    def run(self):
+        delay = BACKOFF_INITIAL
+        while True:
+            try:
+                self._drain()
+                delay = BACKOFF_INITIAL
+            except Exception as e:
+                self._disconnect()
+                if self.stopping.is_set():
+                    print(f"Base de datos no disponible al detener ({e}); "
+                          f"{self.spool.pending_rows} lecturas quedan en {self.spool.path}")
+                    return
+                print(f"Error escribiendo en la base de datos: {e}. Reintentando en {delay}s")
+                self.stopping.wait(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+                continue
+
+            if self.stopping.is_set():
+                self._disconnect(discard=False)
+                return
+            self.wake.wait(self.max_age)
+            self.wake.clear()
+
+    def _drain(self):
+        """Escribir todo lo pendiente en el spool, en lotes de max_rows"""
+        wrote = False
+        while True:
+            rows, offset = self.spool.read_pending(self.max_rows)
+            if not rows:
+                if wrote and self.detect_outliers:
+                    self._detect_outliers()
+                return
+            if self.writer.conn is None:
+                self.writer.conn = db.acquire()
+            self._maintain()
+            written = self._write(rows)
+            self.spool.commit(offset, len(rows))
+            wrote = True
+            if self.forecaster is not None and written:
+                self._forecast(written)
+
+    def _write(self, rows):
+        """Escribir un lote y retornar las lecturas escritas; las que tienen datos invalidos se apartan.
+
+        Los errores de conexion se propagan para que run() reintente el lote completo.
+        """
+        try:
+            self.writer.write_rows(rows)
+            return rows
+        except DATA_ERRORS as e:
+            self.writer.conn.rollback()
+            print(f"Lote rechazado por la base de datos ({e.pgcode}); se escribe fila por fila")
+        written = []
+        rejected = []
+        for row in rows:
+            try:
+                self.writer.write_rows([row])
+                written.append(row)
+            except DATA_ERRORS as e:
+                self.writer.conn.rollback()
+                rejected.append((row, str(e).strip()))
+        self.spool.reject(rejected)
+        print(f"   {len(rejected)} lecturas rechazadas guardadas en {self.spool.reject_path}")
+        return written
+
+    def _detect_outliers(self):
+        """Evaluar las lecturas recien escritas; un error aqui no detiene la escritura"""
+        try:
+            _, alerts = process_new_readings(self.writer.conn)
+        except psycopg2.DatabaseError as e:
+            self.writer.conn.rollback()
+            print(f"Error en la deteccion de outliers: {e}")
+            return
+        for msg in alerts:
+            print(f"   ALERTA: {msg}")
+
+    def _forecast(self, rows):
+        """Aprender del lote escrito y guardar el pronostico de cada estacion; un error no detiene la escritura"""
+        try:
+            self.forecaster.process(self.writer.conn, rows, READING_COLUMNS)
+        except psycopg2.DatabaseError as e:
+            self.writer.conn.rollback()
+            print(f"Error guardando pronosticos: {e}")
+
+    def _maintain(self):
+        """Mantener particiones de current_weather (si la tabla esta particionada); la retencion solo desprende"""
+        if self.last_maintenance is not None and time.monotonic() - self.last_maintenance < PARTITION_CHECK_SECONDS:
+            return
+        self.last_maintenance = time.monotonic()
+        try:
+            created, removed = maintain_partitions(self.writer.conn, drop=False)
+        except psycopg2.DatabaseError as e:
+            # Un problema de mantenimiento no debe detener la escritura de lecturas
+            self.writer.conn.rollback()
+            print(f"Error manteniendo particiones: {e}")
+            return
+        if created or removed:
+            print(f"Particiones creadas: {len(created)} | retiradas: {len(removed)}")
+
+    def _disconnect(self, discard=True):
+        """Devolver la conexion al pool; tras un error se descarta para reconectar"""
+        if self.writer.conn is not None:
+            db.release(self.writer.conn, discard=discard)
+        self.writer.conn = None